@@ -1,7 +1,14 @@
+import contextlib
 import dataclasses
 import datetime
+import fcntl
+import json
 import logging
+import os
+import threading
 import typing
+import uuid
+from pathlib import Path
 
 import pymongo.errors
 
@@ -116,14 +123,116 @@ def _submit_event(event: Event):
         "data": out
     }
 
-    try:
-        with pymongo.timeout(5):
-            _COLLECTION.insert_one(entity)
-    except pymongo.errors.PyMongoError as e:
-        if e.timeout:
-            logging.getLogger(__name__).warning("MongoDB event submission timed out.")
-        else:
-            logging.getLogger(__name__).exception("MongoDB event submission failed.")
+    _get_sink().submit(entity)
+
+
+class EventSink(shared.mongodb.BatchWriter):
+    """Submits events in batches from a background thread, so slow MongoDB instances don't block the download loop.
+
+    Events that can't be inserted are appended to a local spool file and submitted again after the next successful
+    insert. The spool is shared by all processes (crawler, its workers, web server), so access to it is serialized
+    with a lock file.
+    """
+
+    def __init__(self, collection, spool_path: Path, **kwargs):
+        super().__init__(collection, name=__name__, **kwargs)
+        self.spool_path = spool_path
+        self._spool_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _locked_spool(self):
+        with self._spool_lock:
+            self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.spool_path.with_name(f"{self.spool_path.name}.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # released on close
+                yield
+
+    def insert(self, batch: list[dict]):
+        try:
+            with pymongo.timeout(5):
+                super().insert(batch)
+        except pymongo.errors.BulkWriteError as e:
+            logging.getLogger(__name__).error(f"Failed to insert some of {len(batch)} events: {e.details!r}")
+            self.on_failed(_failed_documents(batch, e))
+            return
+        except pymongo.errors.PyMongoError as e:
+            if e.timeout:
+                logging.getLogger(__name__).warning("MongoDB event submission timed out.")
+                self.on_failed(batch)
+                return
+            else:
+                raise
+
+        self.replay_spool()
+
+    def on_failed(self, batch: list[dict]):
+        if not batch:
+            return
+
+        with self._locked_spool():
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for entity in batch:
+                    entity.pop("_id", None)  # set by insert_many
+                    f.write(json.dumps(entity) + "\n")
+
+        logging.getLogger(__name__).info(f"Spooled {len(batch)} events to {self.spool_path!s}.")
+
+    def replay_spool(self):
+        # unique, so concurrent replays of other processes don't clobber each other
+        replay_path = self.spool_path.with_name(f"{self.spool_path.name}.{os.getpid()}-{uuid.uuid4().hex}.replay")
+
+        with self._locked_spool():
+            try:
+                self.spool_path.rename(replay_path)
+            except FileNotFoundError:
+                return
+
+        with open(replay_path, "r", encoding="utf-8") as f:
+            entities = [json.loads(line) for line in f if line.strip()]
+
+        logging.getLogger(__name__).info(f"Submitting {len(entities)} spooled events.")
+
+        failed = []
+        for i in range(0, len(entities), self.max_batch_size):
+            chunk = entities[i:i + self.max_batch_size]
+            try:
+                with pymongo.timeout(30):
+                    self.collection.insert_many(chunk, ordered=False)
+            except pymongo.errors.BulkWriteError as e:
+                logging.getLogger(__name__).error(f"Failed to submit some spooled events: {e.details!r}")
+                failed += _failed_documents(chunk, e)
+            except pymongo.errors.PyMongoError:
+                logging.getLogger(__name__).exception("Submitting spooled events failed.")
+                failed += entities[i:]
+                break
+
+        self.on_failed(failed)
+
+        replay_path.unlink(missing_ok=True)
+
+
+def _failed_documents(batch: list[dict], error: pymongo.errors.BulkWriteError) -> list[dict]:
+    """Return the documents of an unordered insert_many that were not inserted."""
+    return [
+        batch[write_error["index"]]
+        for write_error in error.details.get("writeErrors", [])
+        if write_error.get("code") != 11000  # duplicate key, already inserted
+    ]
+
+
+_SINK: EventSink | None = None
+_SINK_LOCK = threading.Lock()
+
+
+def _get_sink() -> EventSink:
+    global _SINK
+
+    if _SINK is None:
+        with _SINK_LOCK:
+            if _SINK is None:
+                _SINK = EventSink(_COLLECTION, Path(".cache") / "events_spool.jsonl")
+
+    return _SINK
 
 
 def submit_event(event: Event):
@@ -0,0 +1,68 @@
+"""Streaming readers for Indiware XML files.
+
+Unlike ET.fromstring, these never build the whole element tree. Elements are yielded as soon as they are complete
+and detached from the tree afterwards, and readers that only need the beginning of a file stop parsing early.
+"""
+
+from __future__ import annotations
+
+import datetime
+import typing
+from xml.etree import ElementTree as ET
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_events(content: str | bytes,
+                 events: tuple[str, ...] = ("end",)) -> typing.Generator[tuple[str, ET.Element], None, None]:
+    parser = ET.XMLPullParser(events)
+
+    for i in range(0, len(content), _CHUNK_SIZE):
+        parser.feed(content[i:i + _CHUNK_SIZE])
+        yield from parser.read_events()
+
+    parser.close()
+    yield from parser.read_events()
+
+
+def _tag_matches(element: ET.Element, tags: typing.Collection[str]) -> bool:
+    # VpMobil files use "FreieTage", substitution plans "freietage"
+    return element.tag.lower() in tags
+
+
+def iter_elements(content: str | bytes, tag: str) -> typing.Generator[ET.Element, None, None]:
+    """Yield all elements with the given tag (case-insensitive). Completed elements are detached from their parents,
+    so memory use does not grow with the size of the file."""
+    tags = {tag.lower()}
+    parents: list[ET.Element] = []
+    open_matches = 0
+
+    for event, element in _iter_events(content, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            open_matches += _tag_matches(element, tags)
+            continue
+
+        parents.pop()
+
+        if _tag_matches(element, tags):
+            open_matches -= 1
+            yield element
+
+        # elements inside a match must stay attached until the match is complete
+        if open_matches == 0 and parents:
+            parents[-1].remove(element)
+
+
+def read_free_days(content: str | bytes) -> list[datetime.date]:
+    """Return the free days listed in a VpMobil or substitution plan file. Stops parsing after the free days, which
+    follow the header."""
+    for _, element in _iter_events(content):
+        if _tag_matches(element, {"freietage"}):
+            return [
+                datetime.datetime.strptime(free_day.text.strip(), "%y%m%d").date()
+                for free_day in element
+                if free_day.text and free_day.text.strip()
+            ]
+
+    return []
@@ -3,9 +3,13 @@ from __future__ import annotations
 
 import argparse
 import concurrent.futures
+import concurrent.futures.process
 import datetime
 import asyncio
 import logging
+import multiprocessing
+import threading
+import typing
 from pathlib import Path
 
 import pipifax_proxy_manager
@@ -19,23 +23,109 @@ from . import events
 from shared.creds_provider import get_creds_provider
 from .plan_downloader import PlanDownloader
 from shared.cache import Cache
-from .plan_processor import PlanProcessor
+from .plan_processor import PlanProcessor, update_day_plans_in_worker, init_worker_logging, worker_logging_initargs
+from .teacher import Teacher
+from .request_budget import RequestBudget
+
+
+class PlanComputePool:
+    """Process pool shared by all crawlers. A pool whose worker died (OOM, segfault) rejects all further jobs, so it is
+    replaced by a new one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.executor = self._create_executor()
+
+    @staticmethod
+    def _create_executor() -> concurrent.futures.ProcessPoolExecutor:
+        # spawn instead of fork, the main process runs an event loop and several threads
+        return concurrent.futures.ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"),
+                                                      initializer=init_worker_logging,
+                                                      initargs=worker_logging_initargs())
+
+    def replace_broken(self, executor: concurrent.futures.ProcessPoolExecutor):
+        """Replace executor unless another crawler already did."""
+        with self._lock:
+            if self.executor is executor:
+                self.executor = self._create_executor()
+                executor.shutdown(wait=False)
 
 
 class PlanCrawler:
     school_number: str
 
-    def __init__(self, school_number: str, plan_downloader: PlanDownloader, plan_processor: PlanProcessor):
+    def __init__(self, school_number: str, plan_downloader: PlanDownloader, plan_processor: PlanProcessor, *,
+                 plan_compute_pool: PlanComputePool | None = None):
         self.school_number = school_number
         self.plan_downloader = plan_downloader
         self.plan_processor = plan_processor
-        self._plan_compute_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-        self._plan_compute_awaiter_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        # usually a process pool shared by all schools, day plans are processed in-process if None
+        self._plan_compute_pool = plan_compute_pool
+        # one processing cycle per school at a time, so that no two cycles process the same day concurrently
+        self._plan_compute_awaiter_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def process_plans(self, dates: typing.Iterable[datetime.date]):
+        """Process the plans of the given days in parallel, then update meta data once all days are done if a revision
+        was processed."""
+        did_migrate_a_plan = False
+
+        if self._plan_compute_pool is None:
+            for date in dates:
+                did_migrate_a_plan |= self.plan_processor.update_day_plans(date)
+        else:
+            results = self._process_plans_in_pool(list(dates))
+
+            # in submission order, like in-process processing would have added them
+            for did_migrate, added_teachers in results:
+                did_migrate_a_plan |= did_migrate
+                self.plan_processor.teachers.add_teachers(*added_teachers)
+
+        if did_migrate_a_plan:
+            self.plan_processor.update_after_plan_processing()
+
+    def _process_plans_in_pool(self, dates: list[datetime.date],
+                               attempts: int = 2) -> list[tuple[bool, list[Teacher]]]:
+        for attempt in range(1, attempts + 1):
+            executor = self._plan_compute_pool.executor
+            try:
+                futures = [
+                    executor.submit(
+                        update_day_plans_in_worker, self.plan_processor.cache.path, self.school_number, date,
+                        self.plan_processor.block_config
+                    )
+                    for date in dates
+                ]
+            except concurrent.futures.process.BrokenProcessPool:
+                futures = []
+            else:
+                concurrent.futures.wait(futures)
+
+            if futures and not any(
+                isinstance(future.exception(), concurrent.futures.process.BrokenProcessPool) for future in futures
+            ):
+                # raise the first error only after all days are done
+                return [future.result() for future in futures]
+
+            self.plan_processor._logger.error(f"A plan processing worker died, replacing the process pool. "
+                                              f"(Attempt {attempt}/{attempts})")
+            self._plan_compute_pool.replace_broken(executor)
+
+        raise RuntimeError(f"Plan processing workers died in all {attempts} attempts.")
+
+    def update_all_plans(self):
+        """Process all stored days, which migrates revisions processed by older versions."""
+        self.plan_processor._logger.info("* Migrating cache...")
+        self.process_plans(self.plan_processor.cache.get_days())
 
     async def check_infinite(self, interval: int = 60, *, once: bool = False, ignore_exceptions: bool = False):
         try:
             self.plan_downloader.update_all_newest()
-            self.plan_processor.do_full_update()
+            # may process every revision of the school, so keep it off the event loop shared by all schools
+            await asyncio.get_running_loop().run_in_executor(
+                self._plan_compute_awaiter_executor, self.update_all_plans
+            )
+            if not once:
+                await self.plan_downloader.load_upload_history()
         except Exception as e:
             if not ignore_exceptions:
                 raise
@@ -49,10 +139,7 @@ class PlanCrawler:
 
                 def _process_plans(t_start: datetime.datetime):
                     try:
-                        self._plan_compute_executor.map(
-                            self.plan_processor.update_day_plans, updated_dates
-                        )
-                        self.plan_processor.update_after_plan_processing()
+                        self.process_plans(updated_dates)
                         events.submit_event(
                             events.PlanCrawlCycle(
                                 school_number=self.school_number,
@@ -81,18 +168,23 @@ class PlanCrawler:
             if once:
                 break
 
-            self.plan_downloader._logger.debug(f"* Waiting {interval} s.")
-            await asyncio.sleep(interval)
+            wait_time = self.plan_downloader.next_poll_interval(interval)
+            self.plan_downloader._logger.debug(f"* Waiting {wait_time:.0f} s.")
+            await asyncio.sleep(wait_time)
 
 
 async def get_crawlers(
     proxied_session: pipifax_proxy_manager.ProxiedSession | None = None,
-    create_clients: bool = True
+    create_clients: bool = True,
+    request_budget: RequestBudget | None = None
 ) -> dict[str, PlanCrawler]:
     creds_provider = get_creds_provider(Path("creds.json"))
     _creds = creds_provider.get_creds()
 
-    request_executor = concurrent.futures.ThreadPoolExecutor(max_workers=20)
+    # shared by all schools
+    request_budget = RequestBudget() if request_budget is None else request_budget
+    request_executor = concurrent.futures.ThreadPoolExecutor(max_workers=request_budget.max_concurrent)
+    plan_compute_pool = PlanComputePool() if create_clients else None
 
     crawlers = {}
 
@@ -126,11 +218,11 @@ async def get_crawlers(
         else:
             client = None
 
-        plan_downloader = PlanDownloader(specifier, client, cache, logger=logger)
+        plan_downloader = PlanDownloader(specifier, client, cache, logger=logger, request_budget=request_budget)
         plan_processor = PlanProcessor(cache, specifier, logger=logger)
 
         # create crawler
-        p = PlanCrawler(specifier, plan_downloader, plan_processor)
+        p = PlanCrawler(specifier, plan_downloader, plan_processor, plan_compute_pool=plan_compute_pool)
 
         crawlers[specifier] = p
 
@@ -152,7 +244,15 @@ async def main():
                                  help="Never crash the program if no more proxies seem to be available. "
                                       "Keep trying instead.")
     argument_parser.add_argument("-interval", "-i", type=int, default=60,
-                                 help="Interval in seconds between each download cycle.")
+                                 help="Interval in seconds between each download cycle while schools usually upload "
+                                      "plans. Outside of these times, polling backs off to up to six times this "
+                                      "interval.")
+    argument_parser.add_argument("--max-concurrent-requests", type=int, default=20,
+                                 help="Maximum number of concurrent requests of all schools together.")
+    argument_parser.add_argument("--max-concurrent-requests-per-host", type=int, default=8,
+                                 help="Maximum number of concurrent requests to a single host.")
+    argument_parser.add_argument("--requests-per-second", type=float, default=10,
+                                 help="Maximum number of requests started per second by all schools together.")
     argument_parser.add_argument("-loglevel", "-l", default="INFO")
 
     args = argument_parser.parse_args()
@@ -170,7 +270,12 @@ async def main():
     proxied_session = pipifax_proxy_manager.config.build_proxied_session(Path("proxy-config.toml"))
     proxied_session.ignore_ssl = False
 
-    crawlers = await get_crawlers(proxied_session=proxied_session, create_clients=not args.only_process)
+    request_budget = RequestBudget(max_concurrent=args.max_concurrent_requests,
+                                   requests_per_second=args.requests_per_second,
+                                   max_concurrent_per_host=args.max_concurrent_requests_per_host)
+
+    crawlers = await get_crawlers(proxied_session=proxied_session, create_clients=not args.only_process,
+                                  request_budget=request_budget)
     try:
         if args.only_process:
             for crawler in crawlers.values():
@@ -1,23 +1,26 @@
 from __future__ import annotations
 
+import collections
+import dataclasses
 import datetime
+import json
 import logging
+import os
 import threading
 import typing
 from xml.etree import ElementTree as ET
 
-from stundenplan24_py import indiware_mobil
-
 from shared.cache import Cache
+from . import parsed_plans
 from .models import DefaultTimesInfo, Plan
-from .teacher import Teacher
+from .teacher import Teacher, TeacherSightings
 
 
 class DailyMetaExtractor:
     """Extracts meta information for a single day's plan."""
 
     def __init__(self, plankl_file: str):
-        self.form_plan = indiware_mobil.IndiwareMobilPlan.from_xml(ET.fromstring(plankl_file))
+        self.form_plan = parsed_plans.indiware_mobil_plan(plankl_file)
         # self.plan = Plan.from_form_plan(self.form_plan)
 
     def teachers(self) -> list[Teacher]:
@@ -82,46 +85,251 @@ class DailyMetaExtractor:
         return self.form_plan.free_days
 
 
+class DailyExtractorCache:
+    """Thread-safe LRU of DailyMetaExtractors bounded by the number of entries and their estimated memory usage.
+
+    Parsed plans that are also held by the ParsedPlanCache are not counted towards the memory usage, they are
+    accounted for there.
+    """
+
+    # a parsed plan takes roughly this many times the size of its XML in memory
+    SIZE_FACTOR: typing.ClassVar[int] = 8
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> (extractor, estimated size)
+        self._entries: collections.OrderedDict[typing.Hashable, tuple[DailyMetaExtractor, int]] = (
+            collections.OrderedDict()
+        )
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: typing.Hashable) -> DailyMetaExtractor | None:
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key: typing.Hashable, extractor: DailyMetaExtractor, xml_size: int):
+        size = 0 if parsed_plans.is_cached(extractor.form_plan) else xml_size * self.SIZE_FACTOR
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            self._entries[key] = extractor, size
+            self._size += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                self._size -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> str:
+        with self._lock:
+            return (f"{len(self._entries)} entries, ~{self._size / 1024 / 1024:.1f} MiB, {self.hits} hits, "
+                    f"{self.misses} misses, {self.evictions} evictions")
+
+
+# shared by all MetaExtractors of the process, keyed by (cache path, day, timestamp)
+# revisions are mostly read once since their meta summaries are stored, so a few entries suffice
+_daily_extractors = DailyExtractorCache(
+    max_entries=int(os.getenv("DAILY_EXTRACTOR_CACHE_SIZE", 4)),
+    max_bytes=int(os.getenv("DAILY_EXTRACTOR_CACHE_BYTES", 64 * 1024 * 1024))
+)
+
+
+@dataclasses.dataclass
+class RevisionMeta:
+    """Meta information of a single revision's PlanKl.xml, stored beside the revision as meta_summary.json so that
+    the plan only has to be parsed once."""
+
+    VERSION: typing.ClassVar[str] = "1"
+
+    date: datetime.date
+    rooms: set[str]
+    forms: list[str]
+    # plan_short -> subjects
+    teachers: dict[str, set[str]]
+    default_times: dict[str, DefaultTimesInfo]
+    # form -> class number -> class
+    courses: dict[str, dict[str, dict]]
+    free_days: list[datetime.date]
+
+    @classmethod
+    def from_extractor(cls, extractor: DailyMetaExtractor) -> RevisionMeta:
+        teachers: dict[str, set[str]] = {}
+        for teacher in extractor.teachers():
+            teachers.setdefault(teacher.plan_short, set()).update(teacher.subjects)
+
+        forms = extractor.forms()
+
+        return cls(
+            date=extractor.form_plan.date,
+            rooms=extractor.rooms(),
+            forms=forms,
+            teachers=teachers,
+            default_times=extractor.default_times(),
+            courses={form: extractor.courses(form) for form in forms},
+            free_days=list(extractor.free_days()),
+        )
+
+    def serialize(self) -> dict:
+        def serialize_time(time: datetime.time | None) -> str | None:
+            return time.isoformat() if time is not None else None
+
+        return {
+            "version": self.VERSION,
+            "date": self.date.isoformat(),
+            "rooms": sorted(self.rooms),
+            "forms": self.forms,
+            "teachers": {plan_short: sorted(subjects) for plan_short, subjects in self.teachers.items()},
+            "default_times": {
+                form: {
+                    str(period): [serialize_time(start), serialize_time(end)]
+                    for period, (start, end) in default_times.data.items()
+                }
+                for form, default_times in self.default_times.items()
+            },
+            "courses": self.courses,
+            "free_days": [day.isoformat() for day in self.free_days],
+        }
+
+    @classmethod
+    def deserialize(cls, data: dict) -> RevisionMeta:
+        def deserialize_time(time: str | None) -> datetime.time | None:
+            return datetime.time.fromisoformat(time) if time is not None else None
+
+        return cls(
+            date=datetime.date.fromisoformat(data["date"]),
+            rooms=set(data["rooms"]),
+            forms=data["forms"],
+            teachers={plan_short: set(subjects) for plan_short, subjects in data["teachers"].items()},
+            default_times={
+                form: DefaultTimesInfo({
+                    int(period): (deserialize_time(start), deserialize_time(end))
+                    for period, (start, end) in default_times.items()
+                })
+                for form, default_times in data["default_times"].items()
+            },
+            courses=data["courses"],
+            free_days=[datetime.date.fromisoformat(day) for day in data["free_days"]],
+        )
+
+
 class MetaExtractor:
-    def __init__(self, cache: Cache, num_last_days: int | None = 10, *, logger: logging.Logger):
+    def __init__(self, cache: Cache, num_last_days: int | None = 10, *, logger: logging.Logger,
+                 cache_extractors: bool = True):
         self._logger = logger
 
         self.cache = cache
         self.num_last_days = num_last_days
 
         self._rooms: set[str] | None = None
-        self._daily_extractors: dict[tuple[datetime.date, datetime.datetime], DailyMetaExtractor] = {}
-        self._daily_extractors_lock = threading.Lock()
-        self._max_cached_extractors = 1
+        self._daily_extractors = _daily_extractors if cache_extractors else DailyExtractorCache(max_entries=0)
+
+        # meta index, summaries of the revisions of the last num_last_days days, None for revisions without a plan
+        self._revision_metas: dict[tuple[datetime.date, datetime.datetime], RevisionMeta | None] = {}
+        self._revision_metas_lock = threading.Lock()
+
+    def daily_extractor(self, day: datetime.date, timestamp: datetime.datetime) -> DailyMetaExtractor | None:
+        if (extractor := self._daily_extractors.get((self.cache.path, day, timestamp))) is not None:
+            return extractor
+
+        try:
+            plan_kl = self.cache.get_plan_file(day, timestamp, "PlanKl.xml")
+        except FileNotFoundError:
+            return None
+
+        try:
+            extractor = DailyMetaExtractor(plan_kl)
+        except ET.ParseError:
+            self._logger.error(f"Failed to parse PlanKl.xml for {day!s} {timestamp!s}.")
+            return None
+
+        self._daily_extractors.put((self.cache.path, day, timestamp), extractor, len(plan_kl))
+
+        return extractor
 
     def iterate_daily_extractors(self) -> typing.Generator[DailyMetaExtractor, None, None]:
         for day in self.cache.get_days()[:self.num_last_days]:
             for timestamp in self.cache.get_timestamps(day):
                 self._logger.log(5, f"Yielding DailyMetaExtractor for {day!s} {timestamp!s}.")
-                if (day, timestamp) in self._daily_extractors:
-                    yield self._daily_extractors[(day, timestamp)]
-                else:
-                    try:
-                        plan_kl = self.cache.get_plan_file(day, timestamp, "PlanKl.xml")
-                    except FileNotFoundError:
-                        continue
-
-                    try:
-                        extractor = DailyMetaExtractor(plan_kl)
-                    except ET.ParseError:
-                        self._logger.error(f"Failed to parse PlanKl.xml for {day!s} {timestamp!s}.")
-                        continue
-
-                    with self._daily_extractors_lock:
-                        self._daily_extractors[(day, timestamp)] = extractor
-                        while len(self._daily_extractors) > self._max_cached_extractors:
-                            self._daily_extractors.pop(next(iter(self._daily_extractors)))
-
+                extractor = self.daily_extractor(day, timestamp)
+                if extractor is not None:
                     yield extractor
 
+    def revision_meta(self, day: datetime.date, timestamp: datetime.datetime) -> RevisionMeta | None:
+        """Return the meta summary of a revision, None if it has no PlanKl.xml. Computed from its PlanKl.xml and stored
+        on first use."""
+        try:
+            return self._revision_metas[(day, timestamp)]
+        except KeyError:
+            pass
+
+        try:
+            data = json.loads(self.cache.get_plan_file(day, timestamp, "meta_summary.json"))
+            meta = RevisionMeta.deserialize(data) if data.get("version") == RevisionMeta.VERSION else None
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            meta = None
+
+        if meta is None:
+            self._logger.debug(f"Extracting meta summary for {day!s} {timestamp!s}.")
+            extractor = self.daily_extractor(day, timestamp)
+            if extractor is not None:
+                meta = RevisionMeta.from_extractor(extractor)
+                self.cache.store_plan_file(day, timestamp, json.dumps(meta.serialize()), "meta_summary.json")
+
+        with self._revision_metas_lock:
+            self._revision_metas[(day, timestamp)] = meta
+
+        return meta
+
+    def iterate_revision_metas(self) -> typing.Generator[RevisionMeta, None, None]:
+        """Yield the meta summaries of the revisions of the last num_last_days days, newest first."""
+        for _, _, meta in self._iterate_revision_metas():
+            yield meta
+
+    def _iterate_revision_metas(
+        self
+    ) -> typing.Generator[tuple[datetime.date, datetime.datetime, RevisionMeta], None, None]:
+        keys = [
+            (day, timestamp)
+            for day in self.cache.get_days()[:self.num_last_days]
+            for timestamp in self.cache.get_timestamps(day)
+        ]
+
+        # forget revisions that are out of the window, before yielding, as callers may stop early
+        with self._revision_metas_lock:
+            for key in self._revision_metas.keys() - set(keys):
+                del self._revision_metas[key]
+
+        for day, timestamp in keys:
+            meta = self.revision_meta(day, timestamp)
+            if meta is not None:
+                yield day, timestamp, meta
+
     def is_available(self) -> bool:
         try:
-            next(self.iterate_daily_extractors())
+            next(self.iterate_revision_metas())
             return True
         except StopIteration:
             return False
@@ -132,20 +340,44 @@ class MetaExtractor:
 
         rooms: set[str] = set()
 
-        for extractor in self.iterate_daily_extractors():
-            rooms.update(extractor.rooms())
+        for meta in self.iterate_revision_metas():
+            rooms.update(meta.rooms)
 
         self._rooms = rooms
         return rooms
 
-    def teachers(self) -> list[Teacher]:
-        return sum((e.teachers() for e in self.iterate_daily_extractors()), [])
+    def teacher_sightings(
+        self,
+        processed_revisions: typing.Container[str] = ()
+    ) -> tuple[dict[str, TeacherSightings], set[str]]:
+        """Aggregate the teacher sightings of all revisions not in processed_revisions per teacher.
+
+        Also return the keys of all revisions that were considered, to be passed as processed_revisions next time."""
+        sightings: dict[str, TeacherSightings] = {}
+        revisions: set[str] = set()
+
+        for day, timestamp, meta in self._iterate_revision_metas():
+            key = f"{day.isoformat()}/{timestamp.isoformat()}"
+            revisions.add(key)
+
+            if key in processed_revisions:
+                continue
+
+            for plan_short, subjects in meta.teachers.items():
+                try:
+                    teacher_sightings = sightings[plan_short]
+                except KeyError:
+                    sightings[plan_short] = TeacherSightings(set(subjects), meta.date, meta.date)
+                else:
+                    teacher_sightings.add(subjects, meta.date)
+
+        return sightings, revisions
 
     def forms(self) -> list[str]:
         forms: set[str] = set()
 
-        for extractor in self.iterate_daily_extractors():
-            forms.update(extractor.forms())
+        for meta in self.iterate_revision_metas():
+            forms.update(meta.forms)
             # takes wayyy to long to iterate all extractors
             if forms:
                 break
@@ -156,8 +388,8 @@ class MetaExtractor:
         all_forms = set(self.forms())
         out = {}
 
-        for extractor in self.iterate_daily_extractors():
-            out |= extractor.default_times()
+        for meta in self.iterate_revision_metas():
+            out |= meta.default_times
 
             if set(out.keys()) == all_forms:
                 break
@@ -173,18 +405,18 @@ class MetaExtractor:
             for day in self.cache.get_days(reverse=False)
         }
 
-    def courses_data(self, forms: typing.Iterable[str]) -> dict[str, list[str]]:
-        for extractor in self.iterate_daily_extractors():
+    def courses_data(self, forms: typing.Iterable[str]) -> dict[str, dict[str, dict]]:
+        for meta in self.iterate_revision_metas():
             return {
-                form: extractor.courses(form)
+                form: meta.courses.get(form, {})
                 for form in forms
             }
 
         return {}
 
     def free_days(self) -> list[datetime.date]:
-        for extractor in self.iterate_daily_extractors():
-            return extractor.free_days()
+        for meta in self.iterate_revision_metas():
+            return meta.free_days
 
         return []
 
@@ -200,5 +432,13 @@ class MetaExtractor:
             for form in courses.keys()
         }
 
+    def log_cache_stats(self):
+        self._logger.debug(f" -> Daily meta extractor cache: {self._daily_extractors.stats()}.")
+
     def invalidate_cache(self):
         self._rooms = None
+
+        # a download may have added the missing PlanKl.xml to a revision
+        with self._revision_metas_lock:
+            for key in [key for key, meta in self._revision_metas.items() if meta is None]:
+                del self._revision_metas[key]
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import collections
+import hashlib
+import os
+import threading
+import typing
+from xml.etree import ElementTree as ET
+
+from stundenplan24_py import indiware_mobil
+from stundenplan24_py import substitution_plan as substitution_plan_sp24
+
+_T = typing.TypeVar("_T")
+
+
+class ParsedPlanCache:
+    """Bounded LRU of parsed plan files keyed by the hash of their content.
+
+    Consecutive revisions mostly share the same underlying XML files, see Cache.get_plan_file(newest_before=True),
+    so the same content would otherwise get parsed again for every revision. The parsed plans are shared between
+    all users and must not be modified.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: collections.OrderedDict[tuple[type, str], typing.Any] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, plan_type: type[_T], content: str, parse: typing.Callable[[str], _T]) -> _T:
+        key = plan_type, hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                return self._entries[key]
+
+        # parse outside the lock, a concurrent miss for the same content just parses twice
+        parsed = parse(content)
+
+        with self._lock:
+            self._entries[key] = parsed
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return parsed
+
+    def contains(self, parsed: typing.Any) -> bool:
+        """Whether the given parsed plan is currently held by the cache."""
+        with self._lock:
+            return any(entry is parsed for entry in self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = ParsedPlanCache(max_entries=int(os.getenv("PARSED_PLAN_CACHE_SIZE", 32)))
+
+
+def is_cached(parsed: typing.Any) -> bool:
+    """Whether a plan returned by this module is still held by the shared cache."""
+    return _cache.contains(parsed)
+
+
+def indiware_mobil_plan(content: str) -> indiware_mobil.IndiwareMobilPlan:
+    """Parse a PlanKl.xml, PlanLe.xml or PlanRa.xml file. The returned plan is shared and must not be modified."""
+    return _cache.get(
+        indiware_mobil.IndiwareMobilPlan, content,
+        lambda data: indiware_mobil.IndiwareMobilPlan.from_xml(ET.fromstring(data))
+    )
+
+
+def substitution_plan(content: str) -> substitution_plan_sp24.SubstitutionPlan:
+    """Parse a VplanKl.xml file. The returned plan is shared and must not be modified."""
+    return _cache.get(
+        substitution_plan_sp24.SubstitutionPlan, content,
+        lambda data: substitution_plan_sp24.SubstitutionPlan.from_xml(ET.fromstring(data))
+    )
@@ -3,15 +3,19 @@ from __future__ import annotations
 import asyncio
 import dataclasses
 import datetime
+import itertools
 import json
 import logging
-from xml.etree import ElementTree as ET
+import threading
+import urllib.parse
 
 from stundenplan24_py import (
     IndiwareStundenplanerClient, IndiwareMobilClient, PlanClientError, SubstitutionPlanClient, UnauthorizedError,
-    substitution_plan, PlanNotFoundError, StudentsSubstitutionPlanEndpoint, TeachersSubstitutionPlanEndpoint
+    PlanNotFoundError, StudentsSubstitutionPlanEndpoint, TeachersSubstitutionPlanEndpoint
 )
-from . import events
+from . import events, indiware_xml
+from .poll_scheduler import PollingScheduler
+from .request_budget import RequestBudget
 
 from shared.cache import Cache
 
@@ -40,20 +44,86 @@ class PlanFileMetadata:
         )
 
 
+class DownloadState:
+    """Metadata of the newest downloaded version of every plan file, stored in a single small meta file, so
+    conditional requests don't need to scan the revisions of a day."""
+
+    def __init__(self, cache: Cache, filename: str = "download_state.json", keep_days: int = 60):
+        self.cache = cache
+        self.filename = filename
+        self.keep_days = keep_days
+
+        self._files: dict[str, dict] | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(date: datetime.date, plan_filename: str) -> str:
+        return f"{date.isoformat()}/{plan_filename}"
+
+    def _load(self) -> dict[str, dict]:
+        if self._files is None:
+            try:
+                self._files = json.loads(self.cache.get_meta_file(self.filename))
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._files = {}
+
+        return self._files
+
+    def get(self, date: datetime.date, plan_filename: str) -> PlanFileMetadata | None:
+        with self._lock:
+            data = self._load().get(self._key(date, plan_filename))
+
+        return PlanFileMetadata.deserialize(data) if data is not None else None
+
+    def set(self, date: datetime.date, revision: datetime.datetime, file_metadata: PlanFileMetadata):
+        with self._lock:
+            files = self._load()
+            files[self._key(date, file_metadata.plan_filename)] = {
+                **file_metadata.serialize(),
+                "revision": revision.isoformat(),
+            }
+
+            min_date = (datetime.date.today() - datetime.timedelta(days=self.keep_days)).isoformat()
+            for key in [key for key in files if key < min_date]:
+                del files[key]
+
+            self.cache.store_meta_file(json.dumps(files), self.filename)
+
+
 class PlanDownloader:
     """Check for new indiware plans in regular intervals store them in cache."""
 
     def __init__(self, school_number: str, client: IndiwareStundenplanerClient, cache: Cache, *,
-                 logger: logging.Logger):
+                 logger: logging.Logger, request_budget: RequestBudget | None = None,
+                 substitution_plan_look_ahead: int = 3, max_concurrent_substitution_plan_requests: int = 4,
+                 max_concurrent_indiware_mobil_requests: int = 4):
         self._logger = logger
 
         self.school_number = school_number
         self.client = client
         self.cache = cache
+        self.download_state = DownloadState(cache)
+        self.scheduler = PollingScheduler()
+        # usually shared by all schools
+        self.request_budget = RequestBudget() if request_budget is None else request_budget
+
+        self._indiware_mobil_semaphore = asyncio.Semaphore(max_concurrent_indiware_mobil_requests)
+
+        # number of school days whose substitution plans are requested at once
+        self.substitution_plan_look_ahead = substitution_plan_look_ahead
+        self._substitution_plan_semaphore = asyncio.Semaphore(max_concurrent_substitution_plan_requests)
+
+        # endpoint url -> (last modified, etag, free days) of the base substitution plan
+        self._base_plan_free_days: dict[
+            str, tuple[datetime.datetime | None, str | None, frozenset[datetime.date]]
+        ] = {}
+
+    def _budget(self, client: IndiwareMobilClient | SubstitutionPlanClient):
+        return self.request_budget.acquire(self.school_number, urllib.parse.urlsplit(client.endpoint.url).hostname)
 
     async def check_infinite(self, interval: int = 60, *, ignore_exceptions: bool = False):
         self.update_all_newest()
-        # await asyncio.sleep(random.randint(0, 5))
+        await self.load_upload_history()
 
         while True:
             try:
@@ -64,8 +134,45 @@ class PlanDownloader:
                 else:
                     self._logger.error("An error occurred while downloading plans.", exc_info=e)
 
-            self._logger.debug(f"Waiting {interval} s.")
-            await asyncio.sleep(interval)
+            wait_time = self.next_poll_interval(interval)
+            self._logger.debug(f"Waiting {wait_time:.0f} s.")
+            await asyncio.sleep(wait_time)
+
+    async def load_upload_history(self, days: int = 42):
+        """Teach the polling scheduler when this school uploaded plans in the past."""
+        if events._COLLECTION is None:
+            return
+
+        since = events.now() - datetime.timedelta(days=days)
+
+        def load() -> list[datetime.datetime]:
+            return [
+                event.last_modified
+                for event in events.iterate_events(events.PlanDownload, self.school_number, since=since)
+                if event.last_modified is not None
+            ]
+
+        try:
+            upload_times = await asyncio.get_running_loop().run_in_executor(None, load)
+        except Exception as e:
+            self._logger.warning("Could not load upload history.", exc_info=e)
+            return
+
+        free_days = self.free_days()
+        for upload_time in upload_times:
+            self.scheduler.record_upload(upload_time, free_days)
+
+        self._logger.debug(f"* Loaded {len(upload_times)} past uploads into the polling scheduler.")
+
+    def free_days(self) -> set[datetime.date]:
+        try:
+            return set(map(datetime.date.fromisoformat, json.loads(self.cache.get_meta_file("meta.json"))["free_days"]))
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return set()
+
+    def next_poll_interval(self, base_interval: float) -> float:
+        """Return the number of seconds to wait before checking for new plans again."""
+        return self.scheduler.next_interval(base_interval, self.free_days())
 
     async def update_fetch(self) -> list[datetime.date]:
         self._logger.debug("* Checking for new plans...")
@@ -84,6 +191,10 @@ class PlanDownloader:
         for fetched_set in fetched:
             new |= fetched_set
 
+        free_days = self.free_days()
+        for date, revision, file_metadata in new:
+            self.scheduler.record_upload(file_metadata.last_modified, free_days)
+
         self.cache.store_meta_file(
             json.dumps({"timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()}),
             "last_fetch.json"
@@ -98,8 +209,9 @@ class PlanDownloader:
     ) -> set[tuple[datetime.date, datetime.datetime, PlanFileMetadata]]:
         try:
             self._logger.debug(f"=> Fetching Indiware Mobil available files.")
-            with events.Timer(self.school_number, events.PlanDownload) as timer:
-                plan_files = await indiware_client.fetch_dates()
+            async with self._budget(indiware_client):
+                with events.Timer(self.school_number, events.PlanDownload) as timer:
+                    plan_files = await indiware_client.fetch_dates()
             timer.submit(plan_type="vpdir.php", last_modified=None, file_length=None, date=None,
                          proxies_used=None)
         except PlanClientError as e:
@@ -119,6 +231,7 @@ class PlanDownloader:
     ) -> set[tuple[datetime.date, datetime.datetime, PlanFileMetadata]]:
         new: set[tuple[datetime.date, datetime.datetime, PlanFileMetadata]] = set()
 
+        downloads = []
         for filename, last_modified in downloadable_plan_files.items():
             if "Plan" not in filename:
                 # this is always the latest day planned, e.g. "Klassen.xml" or "Raeume.xml"
@@ -134,34 +247,55 @@ class PlanDownloader:
             if self.cache.plan_file_exists(date, revision, plan_filename):
                 self._logger.debug(f" -> Skipping indiware {filename!r}. Revision: {revision!s}.")
             else:
-                self._logger.info(f" -> Downloading indiware {filename!r}. Revision: {revision!s}.")
+                downloads.append(self.download_indiware_mobil_file(client, filename, plan_filename, date, revision))
 
-                with events.Timer(self.school_number, events.PlanDownload) as timer:
-                    plan_response = await client.fetch_plan(filename)
+        for downloaded in await asyncio.gather(*downloads):
+            new.add(downloaded)
 
-                assert plan_response.last_modified is not None
-                downloaded_file = PlanFileMetadata(
-                    plan_filename=plan_filename,
-                    last_modified=plan_response.last_modified,
-                    etag=plan_response.etag,
-                )
+        return new
 
-                # noinspection PyUnresolvedReferences
-                timer.submit(plan_type=plan_filename, last_modified=plan_response.last_modified,
-                             file_length=len(plan_response.content), date=date,
-                             proxies_used=plan_response.response._num_proxy_tries)
+    async def download_indiware_mobil_file(
+        self,
+        client: IndiwareMobilClient,
+        filename: str,
+        plan_filename: str,
+        date: datetime.date,
+        revision: datetime.datetime
+    ) -> tuple[datetime.date, datetime.datetime, PlanFileMetadata]:
+        async with self._indiware_mobil_semaphore, self._budget(client):
+            self._logger.info(f" -> Downloading indiware {filename!r}. Revision: {revision!s}.")
 
-                self.cache.store_plan_file(date, revision, plan_response.content, plan_filename)
-                self.cache.store_plan_file(date, revision, json.dumps(downloaded_file.serialize()),
-                                           plan_filename + ".json")
+            with events.Timer(self.school_number, events.PlanDownload) as timer:
+                plan_response = await client.fetch_plan(filename)
 
-                new.add((date, revision, downloaded_file))
-        return new
+        assert plan_response.last_modified is not None
+        downloaded_file = PlanFileMetadata(
+            plan_filename=plan_filename,
+            last_modified=plan_response.last_modified,
+            etag=plan_response.etag,
+        )
+
+        # noinspection PyUnresolvedReferences
+        timer.submit(plan_type=plan_filename, last_modified=plan_response.last_modified,
+                     file_length=len(plan_response.content), date=date,
+                     proxies_used=plan_response.response._num_proxy_tries)
+
+        def store():
+            self.cache.store_plan_file(date, revision, plan_response.content, plan_filename)
+            self.cache.store_plan_file(date, revision, json.dumps(downloaded_file.serialize()),
+                                       plan_filename + ".json")
+            self.download_state.set(date, revision, downloaded_file)
+
+        await asyncio.get_running_loop().run_in_executor(None, store)
+
+        return date, revision, downloaded_file
 
     async def fetch_substitution_plans(self) -> set[tuple[datetime.date, datetime.datetime, PlanFileMetadata]]:
         out = set()
-        for substitution_plan_client in self.client.substitution_plan_clients:
-            out |= await self.fetch_substitution_plan(substitution_plan_client)
+        for fetched in await asyncio.gather(
+            *(self.fetch_substitution_plan(plan_client) for plan_client in self.client.substitution_plan_clients)
+        ):
+            out |= fetched
 
         return out
 
@@ -171,8 +305,14 @@ class PlanDownloader:
     ) -> set[tuple[datetime.date, datetime.datetime, PlanFileMetadata]]:
         self._logger.debug("=> Checking for new substitution plans...")
 
+        cached = self._base_plan_free_days.get(plan_client.endpoint.url)
+        last_modified, etag, free_days = cached if cached is not None else (None, None, None)
+
         try:
-            base_plan = await plan_client.fetch_plan()
+            async with self._budget(plan_client):
+                base_plan = await plan_client.fetch_plan(if_modified_since=last_modified, if_none_match=etag)
+        except stundenplan24_py.NotModifiedError:
+            self._logger.debug(" -> Base substitution plan not modified.")
         except PlanNotFoundError:
             self._logger.debug(f" -> No substitution plan available for {plan_client.endpoint.url!r}.")
             return set()
@@ -181,7 +321,11 @@ class PlanDownloader:
                                f"{plan_client.endpoint.url!r}.")
             return set()
         else:
-            free_days = set(substitution_plan.SubstitutionPlan.from_xml(ET.fromstring(base_plan.content)).free_days)
+            # only the free days are needed, so don't parse the whole plan
+            free_days = frozenset(indiware_xml.read_free_days(base_plan.content))
+            self._base_plan_free_days[plan_client.endpoint.url] = (
+                base_plan.last_modified, base_plan.etag, free_days
+            )
 
         out = set()
 
@@ -197,24 +341,29 @@ class PlanDownloader:
 
                 start += datetime.timedelta(days=step)
 
-        async def iter_backwards():
-            for plan_date in valid_date_iterator(datetime.date.today(), step=-1):
-                try:
-                    out.update(await self.download_substitution_plan(plan_client, plan_date))
-                except PlanNotFoundError:
-                    self._logger.debug(f" -> Stopping substitution plan download at date {plan_date!s}.")
-                    break
+        async def download(plan_date: datetime.date):
+            async with self._substitution_plan_semaphore:
+                return await self.download_substitution_plan(plan_client, plan_date)
 
-        async def iter_forward():
-            for plan_date in valid_date_iterator(datetime.date.today() + datetime.timedelta(days=1), step=1):
-                try:
-                    out.update(await self.download_substitution_plan(plan_client, plan_date))
-                except PlanNotFoundError:
-                    self._logger.debug(f" -> Stopping substitution plan download at date {plan_date!s}.")
-                    break
+        # speculatively request the next few school days at once, stop after the first batch with a missing plan
+        dates = valid_date_iterator(datetime.date.today() + datetime.timedelta(days=1), step=1)
+        while True:
+            batch = list(itertools.islice(dates, self.substitution_plan_look_ahead))
+            results = await asyncio.gather(*(download(plan_date) for plan_date in batch), return_exceptions=True)
+
+            stop = False
+            for plan_date, result in zip(batch, results):
+                if isinstance(result, PlanNotFoundError):
+                    if not stop:
+                        self._logger.debug(f" -> Stopping substitution plan download at date {plan_date!s}.")
+                    stop = True
+                elif isinstance(result, BaseException):
+                    raise result
+                else:
+                    out.update(result)
 
-        # await asyncio.gather(iter_backwards(), iter_forward())
-        await iter_forward()
+            if stop:
+                break
 
         return out
 
@@ -231,21 +380,26 @@ class PlanDownloader:
             assert False
 
         # alternative to first doing a HEAD request: pass newest downloaded last_modified or etag to fetch_plan method
-        # via get_latest_downloaded_file_timestamp() or get_downloaded_file_metadata(last_modified=None)
-        for rev in self.cache.get_timestamps(date):
-            if self.cache.plan_file_exists(date, rev, plan_filename + ".json"):
-                metadata = PlanFileMetadata.deserialize(
-                    json.loads(self.cache.get_plan_file(date, rev, plan_filename + ".json"))
-                )
-                last_modified = metadata.last_modified
-                etag = metadata.etag
-                break
-        else:
-            last_modified = None
-            etag = None
+        metadata = self.download_state.get(date, plan_filename)
+
+        if metadata is None:
+            # not downloaded yet or downloaded before the download state existed
+            for rev in self.cache.get_timestamps(date):
+                if self.cache.plan_file_exists(date, rev, plan_filename + ".json"):
+                    metadata = PlanFileMetadata.deserialize(
+                        json.loads(self.cache.get_plan_file(date, rev, plan_filename + ".json"))
+                    )
+                    self.download_state.set(date, rev, metadata)
+                    break
+
+        last_modified = metadata.last_modified if metadata is not None else None
+        etag = metadata.etag if metadata is not None else None
+
         try:
-            with events.Timer(self.school_number, events.PlanDownload) as timer:
-                plan_response = await plan_client.fetch_plan(date, if_modified_since=last_modified, if_none_match=etag)
+            async with self._budget(plan_client):
+                with events.Timer(self.school_number, events.PlanDownload) as timer:
+                    plan_response = await plan_client.fetch_plan(date, if_modified_since=last_modified,
+                                                                 if_none_match=etag)
         except stundenplan24_py.NotModifiedError:
             self._logger.debug(f" -> Newest revision of substitution plan of {date!s} already downloaded.")
             return set()
@@ -266,6 +420,7 @@ class PlanDownloader:
 
             self.cache.store_plan_file(date, revision, plan_response.content, plan_filename)
             self.cache.store_plan_file(date, revision, json.dumps(downloaded_file.serialize()), plan_filename + ".json")
+            self.download_state.set(date, revision, downloaded_file)
 
             return {(date, revision, downloaded_file)}
 
@@ -4,12 +4,11 @@ import datetime
 import logging
 import typing
 from collections import defaultdict
-from xml.etree import ElementTree as ET
 
 from stundenplan24_py import indiware_mobil
 from stundenplan24_py import substitution_plan as substitution_plan_sp24
 
-from . import lesson_info, default_plan, blocks
+from . import lesson_info, default_plan, blocks, parsed_plans
 from .lesson_info import process_additional_info
 from .teacher import Teacher, Teachers
 from .models import Lesson, Lessons, Plan
@@ -99,7 +98,7 @@ class StudentsPlanExtractor(PlanExtractor):
         self.block_config = block_config
         self.rooms = rooms
 
-        form_plan = indiware_mobil.IndiwareMobilPlan.from_xml(ET.fromstring(plan_kl))
+        form_plan = parsed_plans.indiware_mobil_plan(plan_kl)
         self.plan = Plan.from_form_plan(form_plan)
 
         self._extract_teachers()
@@ -111,7 +110,7 @@ class StudentsPlanExtractor(PlanExtractor):
         if vplan_kl is None:
             self.substitution_plan = None
         else:
-            self.substitution_plan = substitution_plan_sp24.SubstitutionPlan.from_xml(ET.fromstring(vplan_kl))
+            self.substitution_plan = parsed_plans.substitution_plan(vplan_kl)
             self.add_lessons_for_unavailable_from_subst_plan()
 
         self.fill_in_lesson_times()
@@ -294,7 +293,7 @@ class TeachersPlanExtractor:
                  rooms: set[str], *, logger: logging.Logger):
         self._logger = logger
 
-        teacher_plan = indiware_mobil.IndiwareMobilPlan.from_xml(ET.fromstring(plan_le))
+        teacher_plan = parsed_plans.indiware_mobil_plan(plan_le)
         self.teacher_plan_extractor = PlanExtractor()
         self.teacher_plan_extractor.plan = Plan.from_teacher_plan(teacher_plan)
         self.teacher_plan_extractor.teachers = teachers
@@ -304,7 +303,7 @@ class TeachersPlanExtractor:
         self.teacher_plan_extractor.fill_in_lesson_times()
 
         if plan_ra is not None:
-            room_plan = indiware_mobil.IndiwareMobilPlan.from_xml(ET.fromstring(plan_ra))
+            room_plan = parsed_plans.indiware_mobil_plan(plan_ra)
             self.room_plan_extractor = PlanExtractor()
             self.room_plan_extractor.plan = Plan.from_room_plan(room_plan)
             self.room_plan_extractor.teachers = teachers
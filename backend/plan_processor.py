@@ -1,23 +1,82 @@
 from __future__ import annotations
 
 import datetime
+import hashlib
 import json
 import logging
+import typing
 import xml.etree.ElementTree as ET
+from pathlib import Path
 
 from . import schools, default_plan, events, blocks
 from shared.cache import Cache
 from .meta_extractor import MetaExtractor
-from .teacher import Teachers
+from .teacher import Teacher, Teachers
 from .models import PlanLesson, Exam
-from .vplan_utils import group_forms, ParsedForm
+from .vplan_utils import group_forms, ParsedForm, plan_response_data
 from .stats import LessonsStatistics
 from .plan_extractor import StudentsPlanExtractor, TeachersPlanExtractor
 
 
+def _fingerprint(content: str | None) -> str | None:
+    return None if content is None else hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+_STUDENTS_PLAN_INPUTS = ("PlanKl.xml", "VplanKl.xml", "teachers", "block_config")
+_TEACHERS_PLAN_INPUTS = (*_STUDENTS_PLAN_INPUTS, "PlanLe.xml", "PlanRa.xml")
+
+
 class PlanProcessor:
     VERSION = "105"
 
+    # Bump the version of an artifact when the code computing it changes. Only that artifact is then recomputed.
+    ARTIFACT_VERSIONS: typing.ClassVar[dict[str, str]] = {
+        "plans.json": "1",
+        "_default_plan.json": "1",
+        "statistics.json": "1",
+        "exams.json": "1",
+        "rooms.json": "1",
+        "info.json": "1",
+        "plan_response.json": "1",
+        "plans.teachers.json": "1",
+        "info.teachers.json": "1",
+        "rooms.teachers.json": "1",
+        "plan_response.teachers.json": "1",
+    }
+    # inputs each artifact is computed from, a change of any of them recomputes the artifact
+    ARTIFACT_INPUTS: typing.ClassVar[dict[str, tuple[str, ...]]] = {
+        "plans.json": _STUDENTS_PLAN_INPUTS,
+        "_default_plan.json": _STUDENTS_PLAN_INPUTS,
+        "statistics.json": _STUDENTS_PLAN_INPUTS,
+        "exams.json": _STUDENTS_PLAN_INPUTS,
+        "rooms.json": (*_STUDENTS_PLAN_INPUTS, "rooms"),
+        # additional info links to known rooms
+        "info.json": (*_STUDENTS_PLAN_INPUTS, "rooms", "forms"),
+        "plan_response.json": (*_STUDENTS_PLAN_INPUTS, "rooms", "forms"),
+        # the teachers' plans contain the students' form plan
+        "plans.teachers.json": _TEACHERS_PLAN_INPUTS,
+        "info.teachers.json": (*_TEACHERS_PLAN_INPUTS, "rooms", "forms"),
+        "rooms.teachers.json": (*_TEACHERS_PLAN_INPUTS, "rooms"),
+        "plan_response.teachers.json": (*_TEACHERS_PLAN_INPUTS, "rooms", "forms"),
+    }
+    TEACHERS_ARTIFACTS: typing.ClassVar[set[str]] = {
+        "plans.teachers.json", "info.teachers.json", "rooms.teachers.json", "plan_response.teachers.json"
+    }
+    STUDENTS_ARTIFACTS: typing.ClassVar[set[str]] = set(ARTIFACT_VERSIONS) - TEACHERS_ARTIFACTS
+    # artifacts computed from the parsed students' and teachers' plans, the others are assembled from stored ones
+    STUDENTS_PLAN_ARTIFACTS: typing.ClassVar[set[str]] = {
+        "plans.json", "_default_plan.json", "statistics.json", "exams.json", "rooms.json", "info.json",
+        "plans.teachers.json"
+    }
+    TEACHERS_PLAN_ARTIFACTS: typing.ClassVar[set[str]] = {
+        "plans.teachers.json", "info.teachers.json", "rooms.teachers.json"
+    }
+    PLAN_RESPONSE_PARTS: typing.ClassVar[dict[str, tuple[str, ...]]] = {
+        "plan_response.json": ("plans.json", "info.json", "rooms.json", "exams.json"),
+        "plan_response.teachers.json": ("plans.teachers.json", "info.teachers.json", "rooms.teachers.json",
+                                        "exams.json"),
+    }
+
     def __init__(self, cache: Cache, school_number: str, *, logger: logging.Logger):
         self._logger = logger
 
@@ -78,187 +137,308 @@ class PlanProcessor:
 
     def update_plan_revision(self, day: datetime.date, timestamp: datetime.datetime) -> bool:
         if self.cache.plan_file_exists(day, timestamp, ".processed"):
-            if (cur_ver := self.cache.get_plan_file(day, timestamp, ".processed")) == self.VERSION:
+            if (
+                (cur_ver := self.cache.get_plan_file(day, timestamp, ".processed")) == self.VERSION
+                and self.read_artifacts_manifest(day, timestamp)["versions"] == self.ARTIFACT_VERSIONS
+            ):
                 return False
 
             self._logger.info(f"=> Migrating plan for {day!s} {timestamp!s} to current version... "
                               f"({cur_ver!r} -> {self.VERSION!r})")
         else:
+            cur_ver = None
             self._logger.info(f"=> Processing plan for {day!s} {timestamp!s}...")
 
-        self.compute_plan_revision(day, timestamp)
+        self.compute_plan_revision(day, timestamp, adopt_existing=cur_ver == self.VERSION)
 
         return True
 
-    def compute_plan_revision(self, date: datetime.date, timestamp: datetime.datetime):
-        _t1 = events.now()
-        try:
-            plan_kl = self.cache.get_plan_file(date, timestamp, "PlanKl.xml", newest_before=True)
-            try:
-                vplan_kl = self.cache.get_plan_file(date, timestamp, "VplanKl.xml", newest_before=True)
-            except FileNotFoundError:
-                vplan_kl = None
+    def migrate_plan_revision(self, day: datetime.date, timestamp: datetime.datetime, force: bool = False) -> bool:
+        """Compute the revision unless it was already processed with the current versions or force is set. Even if
+        forced, only artifacts whose inputs changed are recomputed."""
+        if force:
+            self.compute_plan_revision(day, timestamp)
+            return True
 
-            all_rooms = self.meta_extractor.rooms()
+        return self.update_plan_revision(day, timestamp)
 
-            students_plan_extractor = StudentsPlanExtractor(
-                plan_kl=plan_kl,
-                vplan_kl=vplan_kl,
-                teachers=self.teachers,
-                rooms=all_rooms,
-                block_config=self.block_config,
-                logger=self._logger
-            )
-        except FileNotFoundError:
-            self._logger.warning(f"=> Could not find Indiware form plan for date {date!s} and timestamp {timestamp!s}.")
-        except ET.ParseError:
-            self._logger.error(f"=> Failed to parse student's plan {date!s} {timestamp!s}.")
-        else:
-            self.cache.store_plan_file(
-                date, timestamp,
-                json.dumps({
-                    "forms": (form_plan := students_plan_extractor.form_plan_extractor.plan()),
-                    "teachers": students_plan_extractor.teacher_plan_extractor.plan(),
-                    "rooms": students_plan_extractor.room_plan_extractor.plan(),
-                }, default=lambda plan_lesson: PlanLesson.serialize(plan_lesson, block_config=self.block_config)),
-                "plans.json"
-            )
-            self.cache.store_plan_file(
-                date, timestamp,
-                json.dumps(students_plan_extractor.default_plan().serialize()),
-                "_default_plan.json"
-            )
-
-            # from .models import Lessons
-            # self.cache.store_plan_file(
-            #     date, timestamp,
-            #     json.dumps({
-            #         "rooms": students_plan_extractor.room_plan_extractor.forms_lessons_grouped.group_by("rooms"),
-            #         "teachers": students_plan_extractor.teacher_plan_extractor.forms_lessons_grouped.group_by("teachers"),
-            #         "forms": students_plan_extractor.form_plan_extractor.forms_lessons_grouped.group_by("forms")
-            #     }, default=Lessons.serialize),
-            #     "_plans_raw.json"
-            # )
-
-            self.cache.store_plan_file(
-                date, timestamp,
-                json.dumps({
-                    "all_lessons": LessonsStatistics.from_lessons(students_plan_extractor.plan.lessons).serialize()
-                }),
-                "statistics.json"
-            )
-
-            self.cache.store_plan_file(
-                date, timestamp,
-                json.dumps(students_plan_extractor.plan.exams, default=Exam.serialize),
-                "exams.json"
-            )
+    def read_artifacts_manifest(self, date: datetime.date, timestamp: datetime.datetime) -> dict:
+        """Versions and input fingerprints the artifacts of a revision were computed with."""
+        try:
+            return json.loads(self.cache.get_plan_file(date, timestamp, ".artifacts.json"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"versions": {}, "artifacts": {}}
+
+    def input_fingerprints(self, plan_kl: str, vplan_kl: str | None, plan_le: str | None, plan_ra: str | None,
+                           all_rooms: typing.Iterable[str], all_forms: typing.Iterable[str]) -> dict[str, str]:
+        """Return the fingerprint of the inputs of each artifact of a revision, see ARTIFACT_INPUTS."""
+        inputs = {
+            "PlanKl.xml": _fingerprint(plan_kl),
+            "VplanKl.xml": _fingerprint(vplan_kl),
+            "PlanLe.xml": _fingerprint(plan_le),
+            "PlanRa.xml": _fingerprint(plan_ra),
+            # sightings, plan_long counts and the scrape timestamp change with every processed plan, but plans only
+            # show the resulting names
+            "teachers": _fingerprint(json.dumps({
+                plan_short: {
+                    key: sorted(value) if key == "subjects" else value
+                    for key, value in teacher.serialize().items()
+                    if key not in ("_plan_long", "last_seen", "first_seen")
+                }
+                for plan_short, teacher in self.teachers.teachers.items()
+            }, sort_keys=True)),
+            "block_config": _fingerprint(json.dumps(sorted(self.block_config.blocks.items()))),
+            "rooms": _fingerprint(json.dumps(sorted(all_rooms))),
+            "forms": _fingerprint(json.dumps(sorted(all_forms))),
+        }
 
-            rooms_data = {
-                "used_rooms_by_period": (used_rooms := students_plan_extractor.used_rooms_by_period()),
-                "free_rooms_by_period": (free_rooms := students_plan_extractor.free_rooms_by_period(all_rooms)),
-                "used_rooms_by_block": students_plan_extractor.rooms_by_block(used_rooms),
-                "free_rooms_by_block": students_plan_extractor.rooms_by_block(free_rooms)
+        return {
+            filename: _fingerprint(json.dumps({name: inputs[name] for name in input_names}, sort_keys=True))
+            for filename, input_names in self.ARTIFACT_INPUTS.items()
+        }
+
+    def outdated_artifacts(self, manifest: dict, fingerprints: dict[str, str], has_teachers_plan: bool) -> set[str]:
+        """Return the artifacts whose version or input fingerprint differs from the ones recorded in manifest."""
+        return {
+            filename
+            for filename in (self.ARTIFACT_VERSIONS if has_teachers_plan else self.STUDENTS_ARTIFACTS)
+            if manifest["artifacts"].get(filename) != {
+                "version": self.ARTIFACT_VERSIONS[filename], "inputs": fingerprints[filename]
             }
+        }
 
-            self.cache.store_plan_file(
-                date, timestamp,
-                json.dumps(rooms_data, default=list),
-                "rooms.json"
-            )
+    def compute_plan_revision(self, date: datetime.date, timestamp: datetime.datetime, adopt_existing: bool = False):
+        """Compute the artifacts of a revision whose version or inputs changed since they were last computed.
 
-            all_forms = self.meta_extractor.forms()
-            all_forms_parsed = [ParsedForm.from_str(f) for f in all_forms]
+        If adopt_existing is set and the revision has no manifest yet, its existing artifacts are taken to be up to
+        date. This is the case for revisions processed with the current VERSION before artifacts were tracked.
+        """
+        _t1 = events.now()
+        manifest = self.read_artifacts_manifest(date, timestamp)
+        computed: dict[str, str] = {}
 
-            self.cache.store_plan_file(
-                date, timestamp,
-                json.dumps(students_plan_extractor.info_data(all_forms_parsed)),
-                "info.json"
-            )
-
-            _t2 = events.now()
-            events.submit_event(events.StudentsRevisionProcessed(
-                school_number=self.school_number,
-                start_time=_t1,
-                end_time=_t2,
-                version=self.VERSION,
-                date=date,
-                revision=timestamp,
-                has_vplan=vplan_kl is not None
-            ))
+        def store(filename: str, content: str) -> str:
+            self.cache.store_plan_file(date, timestamp, content, filename)
+            manifest["artifacts"][filename] = {
+                "version": self.ARTIFACT_VERSIONS[filename], "inputs": fingerprints[filename]
+            }
+            computed[filename] = content
+            return content
 
-            _t1 = events.now()
+        def get(filename: str) -> str:
+            return computed[filename] if filename in computed else self.cache.get_plan_file(date, timestamp, filename)
+
+        try:
+            plan_kl = self.cache.get_plan_file(date, timestamp, "PlanKl.xml", newest_before=True)
+            try:
+                vplan_kl = self.cache.get_plan_file(date, timestamp, "VplanKl.xml", newest_before=True)
+            except FileNotFoundError:
+                vplan_kl = None
             try:
                 plan_le = self.cache.get_plan_file(date, timestamp, "PlanLe.xml", newest_before=True)
+            except FileNotFoundError:
+                plan_le = plan_ra = None
+            else:
                 try:
                     plan_ra = self.cache.get_plan_file(date, timestamp, "PlanRa.xml", newest_before=True)
                 except FileNotFoundError:
                     plan_ra = None
-            except ET.ParseError:
-                self._logger.error(f"=> Failed to parse teacher's plan for {date!s} {timestamp!s}.")
-            except FileNotFoundError:
-                pass
-            else:
-                teachers_plan_extractor = TeachersPlanExtractor(
-                    plan_le=plan_le,
-                    plan_ra=plan_ra,
-                    teachers=self.teachers,
-                    rooms=all_rooms,
-                    logger=self._logger,
-                    block_config=self.block_config
-                )
 
-                teachers_plans = {
-                    "teachers": teachers_plan_extractor.teacher_plan(),
-                    "forms": form_plan,
-                    "rooms": teachers_plan_extractor.room_plan(),
-                }
+            # store the meta summary of this revision now, so update_meta does not have to parse the plan again
+            self.meta_extractor.revision_meta(date, timestamp)
 
-                self.cache.store_plan_file(
-                    date, timestamp,
-                    json.dumps(
-                        teachers_plans,
-                        default=lambda plan_lesson: PlanLesson.serialize(plan_lesson, block_config=self.block_config)
-                    ),
-                    "plans.teachers.json"
-                )
+            all_rooms = self.meta_extractor.rooms()
+            all_forms = self.meta_extractor.forms()
 
-                self.cache.store_plan_file(
-                    date, timestamp,
-                    json.dumps(teachers_plan_extractor.teacher_plan_extractor.info_data(all_forms_parsed)),
-                    "info.teachers.json"
-                )
+            fingerprints = self.input_fingerprints(plan_kl, vplan_kl, plan_le, plan_ra, all_rooms, all_forms)
 
-                teachers_rooms_data = {
-                    "used_rooms_by_period": (
-                        used_rooms := teachers_plan_extractor.teacher_plan_extractor.used_rooms_by_period()
-                    ),
-                    "free_rooms_by_period": (
-                        free_rooms := teachers_plan_extractor.teacher_plan_extractor.free_rooms_by_period(all_rooms)
-                    ),
-                    "used_rooms_by_block": teachers_plan_extractor.teacher_plan_extractor.rooms_by_block(used_rooms),
-                    "free_rooms_by_block": teachers_plan_extractor.teacher_plan_extractor.rooms_by_block(free_rooms)
+            if adopt_existing and not manifest["artifacts"]:
+                manifest["artifacts"] = {
+                    filename: {
+                        "version": self.ARTIFACT_VERSIONS[filename],
+                        "inputs": fingerprints[filename]
+                    }
+                    for filename in self.ARTIFACT_VERSIONS
+                    if self.cache.plan_file_exists(date, timestamp, filename)
                 }
 
-                self.cache.store_plan_file(
-                    date, timestamp,
-                    json.dumps(teachers_rooms_data, default=list),
-                    "rooms.teachers.json"
+            outdated = self.outdated_artifacts(manifest, fingerprints, has_teachers_plan=plan_le is not None)
+
+            # plan responses are assembled from their stored parts
+            for plan_response, parts in self.PLAN_RESPONSE_PARTS.items():
+                if plan_response in outdated:
+                    outdated |= {part for part in parts if not self.cache.plan_file_exists(date, timestamp, part)}
+
+            students_plan_extractor = None
+            if not outdated:
+                self._logger.debug(f" -> Artifacts of {date!s} {timestamp!s} are up to date.")
+            else:
+                self._logger.debug(f" -> Computing {', '.join(sorted(outdated))} for {date!s} {timestamp!s}.")
+
+            # only parse the plans if an artifact computed from them is outdated
+            if outdated & self.STUDENTS_PLAN_ARTIFACTS:
+                students_plan_extractor = StudentsPlanExtractor(
+                    plan_kl=plan_kl,
+                    vplan_kl=vplan_kl,
+                    teachers=self.teachers,
+                    rooms=all_rooms,
+                    block_config=self.block_config,
+                    logger=self._logger
                 )
+        except FileNotFoundError:
+            self._logger.warning(f"=> Could not find Indiware form plan for date {date!s} and timestamp {timestamp!s}.")
+        except ET.ParseError:
+            self._logger.error(f"=> Failed to parse student's plan {date!s} {timestamp!s}.")
+        else:
+            if outdated & self.STUDENTS_ARTIFACTS:
+                self.compute_students_artifacts(students_plan_extractor, outdated, all_rooms, all_forms, store, get)
 
                 _t2 = events.now()
-                events.submit_event(events.TeachersRevisionProcessed(
+                events.submit_event(events.StudentsRevisionProcessed(
                     school_number=self.school_number,
                     start_time=_t1,
                     end_time=_t2,
                     version=self.VERSION,
                     date=date,
-                    revision=timestamp
+                    revision=timestamp,
+                    has_vplan=vplan_kl is not None
                 ))
 
+            if outdated & self.TEACHERS_ARTIFACTS:
+                _t1 = events.now()
+                try:
+                    teachers_plan_extractor = TeachersPlanExtractor(
+                        plan_le=plan_le,
+                        plan_ra=plan_ra,
+                        teachers=self.teachers,
+                        rooms=all_rooms,
+                        logger=self._logger,
+                        block_config=self.block_config
+                    ) if outdated & self.TEACHERS_PLAN_ARTIFACTS else None
+                except ET.ParseError:
+                    self._logger.error(f"=> Failed to parse teacher's plan for {date!s} {timestamp!s}.")
+                else:
+                    self.compute_teachers_artifacts(teachers_plan_extractor, students_plan_extractor, outdated,
+                                                    all_rooms, all_forms, store, get)
+
+                    _t2 = events.now()
+                    events.submit_event(events.TeachersRevisionProcessed(
+                        school_number=self.school_number,
+                        start_time=_t1,
+                        end_time=_t2,
+                        version=self.VERSION,
+                        date=date,
+                        revision=timestamp
+                    ))
+
             self.cache.update_newest(date)
 
-        self.cache.store_plan_file(date, timestamp, str(self.VERSION), ".processed")
+        if computed or manifest["versions"] != self.ARTIFACT_VERSIONS:
+            manifest["versions"] = self.ARTIFACT_VERSIONS
+            self.cache.store_plan_file(date, timestamp, json.dumps(manifest), ".artifacts.json")
+
+        # keep the marker untouched if nothing changed, its mtime is part of the ETag of the plan
+        if (
+            computed
+            or not self.cache.plan_file_exists(date, timestamp, ".processed")
+            or self.cache.get_plan_file(date, timestamp, ".processed") != self.VERSION
+        ):
+            self.cache.store_plan_file(date, timestamp, str(self.VERSION), ".processed")
+
+    def compute_students_artifacts(self, students_plan_extractor: StudentsPlanExtractor | None, outdated: set[str],
+                                   all_rooms: set[str], all_forms: list[str],
+                                   store: typing.Callable[[str, str], str], get: typing.Callable[[str], str]):
+        """students_plan_extractor is None if no artifact in STUDENTS_PLAN_ARTIFACTS is outdated."""
+        def serialize_plan_lesson(plan_lesson: PlanLesson):
+            return PlanLesson.serialize(plan_lesson, block_config=self.block_config)
+
+        if "plans.json" in outdated:
+            store("plans.json", json.dumps({
+                "forms": students_plan_extractor.form_plan_extractor.plan(),
+                "teachers": students_plan_extractor.teacher_plan_extractor.plan(),
+                "rooms": students_plan_extractor.room_plan_extractor.plan(),
+            }, default=serialize_plan_lesson))
+
+        if "_default_plan.json" in outdated:
+            store("_default_plan.json", json.dumps(students_plan_extractor.default_plan().serialize()))
+
+        # from .models import Lessons
+        # self.cache.store_plan_file(
+        #     date, timestamp,
+        #     json.dumps({
+        #         "rooms": students_plan_extractor.room_plan_extractor.forms_lessons_grouped.group_by("rooms"),
+        #         "teachers": students_plan_extractor.teacher_plan_extractor.forms_lessons_grouped.group_by("teachers"),
+        #         "forms": students_plan_extractor.form_plan_extractor.forms_lessons_grouped.group_by("forms")
+        #     }, default=Lessons.serialize),
+        #     "_plans_raw.json"
+        # )
+
+        if "statistics.json" in outdated:
+            store("statistics.json", json.dumps({
+                "all_lessons": LessonsStatistics.from_lessons(students_plan_extractor.plan.lessons).serialize()
+            }))
+
+        if "exams.json" in outdated:
+            store("exams.json", json.dumps(students_plan_extractor.plan.exams, default=Exam.serialize))
+
+        if "rooms.json" in outdated:
+            rooms_data = {
+                "used_rooms_by_period": (used_rooms := students_plan_extractor.used_rooms_by_period()),
+                "free_rooms_by_period": (free_rooms := students_plan_extractor.free_rooms_by_period(all_rooms)),
+                "used_rooms_by_block": students_plan_extractor.rooms_by_block(used_rooms),
+                "free_rooms_by_block": students_plan_extractor.rooms_by_block(free_rooms)
+            }
+            store("rooms.json", json.dumps(rooms_data, default=list))
+
+        if "info.json" in outdated:
+            all_forms_parsed = [ParsedForm.from_str(f) for f in all_forms]
+            store("info.json", json.dumps(students_plan_extractor.info_data(all_forms_parsed)))
+
+        # what the /plan endpoint sends, so it does not have to parse and re-serialize the files above
+        if "plan_response.json" in outdated or not outdated.isdisjoint(self.PLAN_RESPONSE_PARTS["plan_response.json"]):
+            store("plan_response.json", plan_response_data(
+                info=get("info.json"), rooms=get("rooms.json"), plans=get("plans.json"), exams=get("exams.json")
+            ))
+
+    def compute_teachers_artifacts(self, teachers_plan_extractor: TeachersPlanExtractor | None,
+                                   students_plan_extractor: StudentsPlanExtractor | None, outdated: set[str],
+                                   all_rooms: set[str], all_forms: list[str],
+                                   store: typing.Callable[[str, str], str], get: typing.Callable[[str], str]):
+        """teachers_plan_extractor is None if no artifact in TEACHERS_PLAN_ARTIFACTS is outdated."""
+        def serialize_plan_lesson(plan_lesson: PlanLesson):
+            return PlanLesson.serialize(plan_lesson, block_config=self.block_config)
+
+        if "plans.teachers.json" in outdated:
+            teachers_plans = {
+                "teachers": teachers_plan_extractor.teacher_plan(),
+                "forms": students_plan_extractor.form_plan_extractor.plan(),
+                "rooms": teachers_plan_extractor.room_plan(),
+            }
+            store("plans.teachers.json", json.dumps(teachers_plans, default=serialize_plan_lesson))
+
+        if "info.teachers.json" in outdated:
+            all_forms_parsed = [ParsedForm.from_str(f) for f in all_forms]
+            store("info.teachers.json", json.dumps(
+                teachers_plan_extractor.teacher_plan_extractor.info_data(all_forms_parsed)
+            ))
+
+        if "rooms.teachers.json" in outdated:
+            teacher_plan_extractor = teachers_plan_extractor.teacher_plan_extractor
+            teachers_rooms_data = {
+                "used_rooms_by_period": (used_rooms := teacher_plan_extractor.used_rooms_by_period()),
+                "free_rooms_by_period": (free_rooms := teacher_plan_extractor.free_rooms_by_period(all_rooms)),
+                "used_rooms_by_block": teacher_plan_extractor.rooms_by_block(used_rooms),
+                "free_rooms_by_block": teacher_plan_extractor.rooms_by_block(free_rooms)
+            }
+            store("rooms.teachers.json", json.dumps(teachers_rooms_data, default=list))
+
+        if "plan_response.teachers.json" in outdated or not outdated.isdisjoint(
+            self.PLAN_RESPONSE_PARTS["plan_response.teachers.json"]
+        ):
+            store("plan_response.teachers.json", plan_response_data(
+                info=get("info.teachers.json"), rooms=get("rooms.teachers.json"), plans=get("plans.teachers.json"),
+                exams=get("exams.json")
+            ))
 
     def update_meta(self):
         self._logger.info("* Updating meta data...")
@@ -275,12 +455,16 @@ class PlanProcessor:
             self.cache.store_meta_file(json.dumps(data), "meta.json")
             self.cache.store_meta_file(json.dumps(self.meta_extractor.dates_data()), "dates.json")
 
-            self.teachers.add_teachers(*self.meta_extractor.teachers())
+            sightings, revisions = self.meta_extractor.teacher_sightings(self.teachers.processed_revisions)
+            self.teachers.add_sightings(sightings)
+            # revisions that left the window won't be considered again
+            self.teachers.processed_revisions = revisions
             self.scrape_teachers()
             self.update_forms()
             self.update_rooms()
 
         timer.submit()
+        self.meta_extractor.log_cache_stats()
 
     def scrape_teachers(self):
         if datetime.datetime.now() - self.teachers.scrape_timestamp < datetime.timedelta(hours=6):
@@ -387,3 +571,67 @@ class PlanProcessor:
         self.update_meta()
         self.update_default_plan()
         self.store_teachers()
+
+
+# school number -> plan processor, per worker process
+_worker_plan_processors: dict[str, PlanProcessor] = {}
+
+
+def _get_worker_plan_processor(cache_path: Path, school_number: str) -> PlanProcessor:
+    try:
+        return _worker_plan_processors[school_number]
+    except KeyError:
+        plan_processor = PlanProcessor(Cache(cache_path), school_number, logger=logging.getLogger(school_number))
+        _worker_plan_processors[school_number] = plan_processor
+        return plan_processor
+
+
+def init_worker_logging(level: int, fmt: str | None, datefmt: str | None):
+    """Initializer of worker processes. Spawned processes don't inherit the logging configuration."""
+    logging.basicConfig(level=level, format=fmt, datefmt=datefmt, force=True)
+
+
+def worker_logging_initargs() -> tuple[int, str | None, str | None]:
+    """Arguments of init_worker_logging that reproduce the logging configuration of the current process."""
+    root_logger = logging.getLogger()
+    formatter = root_logger.handlers[0].formatter if root_logger.handlers else None
+
+    if formatter is None:
+        return root_logger.level, None, None
+
+    return root_logger.level, formatter._fmt, formatter.datefmt
+
+
+def update_day_plans_in_worker(cache_path: Path, school_number: str, day: datetime.date,
+                               block_config: blocks.BlockConfiguration) -> tuple[bool, list[Teacher]]:
+    """Process the plans of one day in a worker process with the block configuration of the main process. Only reads
+    teachers, never stores them. Returns whether a revision was processed and the teachers found in the plans, which
+    the caller has to add to its teachers."""
+    is_new = school_number not in _worker_plan_processors
+    plan_processor = _get_worker_plan_processor(cache_path, school_number)
+    plan_processor.block_config = block_config
+
+    if not is_new:
+        # teachers and meta data may have been updated by the main process since the last call
+        plan_processor.load_teachers()
+        plan_processor.meta_extractor.invalidate_cache()
+
+    with plan_processor.teachers.record_added() as added_teachers:
+        did_migrate_a_plan = plan_processor.update_day_plans(day)
+
+    return did_migrate_a_plan, added_teachers
+
+
+def migrate_plan_revision_in_worker(cache_path: Path, school_number: str, day: datetime.date,
+                                    timestamp: datetime.datetime, block_config: blocks.BlockConfiguration,
+                                    force: bool = False) -> tuple[bool, list[Teacher]]:
+    """Migrate one plan revision in a worker process with the block configuration of the main process. Only reads
+    teachers, never stores them. Returns whether the revision was migrated and the teachers found in its plans, which
+    the caller has to add to its teachers."""
+    plan_processor = _get_worker_plan_processor(cache_path, school_number)
+    plan_processor.block_config = block_config
+
+    with plan_processor.teachers.record_added() as added_teachers:
+        did_migrate = plan_processor.migrate_plan_revision(day, timestamp, force)
+
+    return did_migrate, added_teachers
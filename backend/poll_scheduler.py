@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import datetime
+import random
+import typing
+
+
+class PollingScheduler:
+    """Decides how long to wait before checking a school for new plans again.
+
+    Schools upload their plans at similar times every week, usually in the morning and in the evening. The scheduler
+    keeps an hourly histogram of observed upload times, separately for school days and days without school (weekends
+    and free days). Hours in which the school used to upload are polled at the base interval, quiet hours are polled
+    less often, down to max_factor times the base interval. Intervals get some jitter so that schools don't end up
+    polling in lockstep.
+    """
+
+    # hours in which schools commonly upload, used as prior until enough uploads were observed
+    # is school day -> hours
+    DEFAULT_ACTIVE_HOURS: typing.ClassVar[dict[bool, set[int]]] = {
+        True: {6, 7, 8, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21},
+        # e.g. plans for monday being uploaded on sunday evening
+        False: {16, 17, 18, 19, 20, 21},
+    }
+
+    def __init__(self, max_factor: float = 6, jitter: float = 0.1, prior_weight: float = 1):
+        self.max_factor = max_factor
+        self.jitter = jitter
+
+        # is school day -> hour -> weighted upload count
+        self.histogram: dict[bool, list[float]] = {
+            is_school_day: [
+                prior_weight * (2 if hour in self.DEFAULT_ACTIVE_HOURS[is_school_day] else 0.25)
+                for hour in range(24)
+            ]
+            for is_school_day in (True, False)
+        }
+
+    @staticmethod
+    def is_school_day(date: datetime.date, free_days: typing.Collection[datetime.date] = ()) -> bool:
+        return date.weekday() < 5 and date not in free_days
+
+    def record_upload(self, timestamp: datetime.datetime, free_days: typing.Collection[datetime.date] = ()):
+        """Record that the school uploaded a plan at the given time."""
+        local = timestamp.astimezone() if timestamp.tzinfo is not None else timestamp
+        self.histogram[self.is_school_day(local.date(), free_days)][local.hour] += 1
+
+    def activity(self, now: datetime.datetime, free_days: typing.Collection[datetime.date] = ()) -> float:
+        """Share of uploads around the current hour relative to a uniform distribution. 1 means average activity."""
+        counts = self.histogram[self.is_school_day(now.date(), free_days)]
+        around_now = sum(counts[(now.hour + offset) % 24] for offset in (-1, 0, 1))
+
+        return around_now / (sum(counts) * 3 / 24)
+
+    def next_interval(self,
+                      base_interval: float,
+                      free_days: typing.Collection[datetime.date] = (),
+                      now: datetime.datetime | None = None) -> float:
+        """Return the number of seconds to wait before polling again."""
+        now = datetime.datetime.now() if now is None else now
+
+        activity = self.activity(now, free_days)
+        factor = min(self.max_factor, max(1.0, 1 / activity)) if activity > 0 else self.max_factor
+
+        return base_interval * factor * random.uniform(1 - self.jitter, 1 + self.jitter)
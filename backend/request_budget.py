@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import time
+import typing
+
+
+class RequestBudget:
+    """Limits the upstream requests of all school crawlers together.
+
+    Bounds the number of concurrent requests, the number of requests started per second and the number of concurrent
+    requests per host. Waiting requests are queued per school and granted round-robin across schools, so a school
+    with many pending downloads can't starve the others.
+    """
+
+    def __init__(self, max_concurrent: int = 20, requests_per_second: float = 10, max_concurrent_per_host: int = 8):
+        self.max_concurrent = max_concurrent
+        self.requests_per_second = requests_per_second
+        self.max_concurrent_per_host = max_concurrent_per_host
+
+        # school -> waiting requests as (host, future)
+        self._waiting: dict[str, collections.deque[tuple[str, asyncio.Future]]] = {}
+        # schools with waiting requests in the order they are served
+        self._rotation: collections.deque[str] = collections.deque()
+
+        self._active = 0
+        self._active_per_host: collections.Counter[str] = collections.Counter()
+        self._next_start = 0.0
+        self._dispatch_scheduled = False
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, school_number: str, host: str) -> typing.AsyncIterator[None]:
+        future = asyncio.get_running_loop().create_future()
+
+        if school_number not in self._waiting:
+            self._waiting[school_number] = collections.deque()
+            self._rotation.append(school_number)
+        self._waiting[school_number].append((host, future))
+
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted, but cancelled before we could use it
+                self._release(host)
+            else:
+                self._remove_waiting(school_number, host, future)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def _remove_waiting(self, school_number: str, host: str, future: asyncio.Future):
+        waiting = self._waiting.get(school_number)
+        if waiting is None:
+            return
+
+        try:
+            waiting.remove((host, future))
+        except ValueError:
+            return
+
+        if not waiting:
+            del self._waiting[school_number]
+            self._rotation.remove(school_number)
+
+    def _discard_cancelled_waiters(self) -> bool:
+        """Drop waiters cancelled before their cleanup in acquire ran, so they are never granted a slot. Returns
+        whether any waiters are left."""
+        for school_number in list(self._rotation):
+            waiting = self._waiting[school_number]
+            while waiting and waiting[0][1].done():
+                waiting.popleft()
+
+            if not waiting:
+                del self._waiting[school_number]
+                self._rotation.remove(school_number)
+
+        return bool(self._rotation)
+
+    def _release(self, host: str):
+        self._active -= 1
+        self._active_per_host[host] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+
+        while self._active < self.max_concurrent and self._discard_cancelled_waiters():
+            now = time.monotonic()
+            if now < self._next_start:
+                if not self._dispatch_scheduled:
+                    self._dispatch_scheduled = True
+                    loop.call_later(self._next_start - now, self._scheduled_dispatch)
+                return
+
+            # first school in rotation whose next request's host has capacity left
+            for school_number in self._rotation:
+                host, future = self._waiting[school_number][0]
+                if self._active_per_host[host] < self.max_concurrent_per_host:
+                    break
+            else:
+                return
+
+            self._rotation.remove(school_number)
+            waiting = self._waiting[school_number]
+            waiting.popleft()
+            if waiting:
+                self._rotation.append(school_number)
+            else:
+                del self._waiting[school_number]
+
+            self._active += 1
+            self._active_per_host[host] += 1
+            self._next_start = max(now, self._next_start) + 1 / self.requests_per_second
+            future.set_result(None)
+
+    def _scheduled_dispatch(self):
+        self._dispatch_scheduled = False
+        self._dispatch()
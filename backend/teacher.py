@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import contextlib
 import dataclasses
 import datetime
 import logging
@@ -93,25 +94,67 @@ class Teacher:
         return self.full_name or self.full_surname or self.plan_long or self.plan_short
 
 
+@dataclasses.dataclass
+class TeacherSightings:
+    """Aggregated sightings of a teacher in plans."""
+    subjects: set[str]
+    first_seen: datetime.date
+    last_seen: datetime.date
+
+    def add(self, subjects: typing.Iterable[str], date: datetime.date):
+        self.subjects.update(subjects)
+        self.first_seen = min(self.first_seen, date)
+        self.last_seen = max(self.last_seen, date)
+
+
 @dataclasses.dataclass
 class Teachers:
     teachers: dict[str, Teacher] = dataclasses.field(default_factory=dict)
     scrape_timestamp: datetime.datetime = datetime.datetime.min
+    # revisions whose sightings were already added, see MetaExtractor.teacher_sightings
+    processed_revisions: set[str] = dataclasses.field(default_factory=set)
+    _added: list[Teacher] | None = dataclasses.field(default=None, init=False, repr=False, compare=False)
 
     def serialize(self) -> dict:
         return {
             "teachers": {teacher.plan_short: teacher.serialize() for teacher in self.teachers.values()},
-            "timestamp": self.scrape_timestamp.isoformat()
+            "timestamp": self.scrape_timestamp.isoformat(),
+            "processed_revisions": sorted(self.processed_revisions)
         }
 
     @classmethod
     def deserialize(cls, data: dict) -> Teachers:
         return cls(
             teachers={key: Teacher.deserialize(teacher) for key, teacher in data["teachers"].items()},
-            scrape_timestamp=datetime.datetime.fromisoformat(data["timestamp"])
+            scrape_timestamp=datetime.datetime.fromisoformat(data["timestamp"]),
+            processed_revisions=set(data.get("processed_revisions", ()))
         )
 
+    def add_sightings(self, sightings: dict[str, TeacherSightings]):
+        """Update teachers in place with aggregated sightings."""
+        for plan_short, teacher_sightings in sightings.items():
+            if not any(c.isalpha() for c in plan_short):
+                logging.getLogger(__name__).debug(f"Trying to add invalid teacher {plan_short!r}.")
+                continue
+
+            try:
+                teacher = self.teachers[plan_short]
+            except KeyError:
+                self.teachers[plan_short] = Teacher(
+                    plan_short=plan_short,
+                    subjects=set(teacher_sightings.subjects),
+                    first_seen=teacher_sightings.first_seen,
+                    last_seen=teacher_sightings.last_seen
+                )
+            else:
+                teacher.subjects |= teacher_sightings.subjects
+                teacher.first_seen = min(teacher.first_seen, teacher_sightings.first_seen)
+                teacher.last_seen = max(teacher.last_seen, teacher_sightings.last_seen)
+
     def add_teachers(self, *teachers: Teacher):
+        if self._added is not None:
+            self._added.extend(teachers)
+
         for teacher in teachers:
             if not any(c.isalpha() for c in teacher.plan_short):
                 logging.getLogger(__name__).debug(f"Trying to add invalid teacher {teacher.plan_short!r}.")
@@ -122,6 +165,16 @@ class Teachers:
             else:
                 self.teachers[teacher.plan_short] = self.teachers[teacher.plan_short].merge(teacher)
 
+    @contextlib.contextmanager
+    def record_added(self) -> typing.Iterator[list[Teacher]]:
+        """Collect the teachers passed to add_teachers within the block, so they can be added to the teachers of
+        another process as well."""
+        self._added = added = []
+        try:
+            yield added
+        finally:
+            self._added = None
+
     def query(self, **attrs) -> list[Teacher]:
         out = []
         for teacher in self.teachers.values():
@@ -0,0 +1,44 @@
+import concurrent.futures
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from shared.cache import Cache
+
+
+class TestRevisionIndex(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp_dir.name)
+        self.day = datetime.date(2024, 1, 8)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def revision(self, minute: int) -> datetime.datetime:
+        return datetime.datetime(2024, 1, 8, 6, minute, tzinfo=datetime.timezone.utc)
+
+    def test_concurrently_created_revisions(self):
+        cache = Cache(self.path)
+        cache.store_plan_file(self.day, self.revision(0), "", "PlanKl.xml")
+        self.assertEqual(len(cache.get_timestamps(self.day)), 1)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(
+                lambda minute: cache.store_plan_file(self.day, self.revision(minute), "", "PlanKl.xml"),
+                range(1, 17)
+            ))
+
+        self.assertEqual(cache.get_timestamps(self.day), [self.revision(minute) for minute in range(16, -1, -1)])
+
+    def test_revision_created_by_other_process(self):
+        cache = Cache(self.path)
+        cache.store_plan_file(self.day, self.revision(0), "", "PlanKl.xml")
+        self.assertEqual(len(cache.get_timestamps(self.day)), 1)
+
+        # another process creates a revision, then this process creates one in the same mtime granularity window
+        cache.get_plan_path(self.day, self.revision(1)).mkdir()
+        cache.store_plan_file(self.day, self.revision(2), "", "PlanKl.xml")
+
+        self.assertEqual(cache.get_timestamps(self.day), [self.revision(2), self.revision(1), self.revision(0)])
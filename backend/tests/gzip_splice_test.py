@@ -0,0 +1,19 @@
+import gzip
+import json
+import unittest
+
+from shared import gzip_splice
+
+
+class TestGzipSplice(unittest.TestCase):
+    def test_splice(self):
+        for data in [b"{}", b'{"a": 1}', json.dumps({"lessons": list(range(100_000))}).encode("utf-8")]:
+            member = gzip_splice.compress(data)
+            self.assertEqual(gzip.decompress(member), data)
+
+            spliced = gzip_splice.splice(b'{"data": ', member, b"}", b', "last_fetch": "2024-01-08"}}')
+            self.assertEqual(gzip.decompress(spliced), b'{"data": ' + data[:-1] + b', "last_fetch": "2024-01-08"}}')
+
+    def test_foreign_member(self):
+        self.assertIsNone(gzip_splice.splice(b"", gzip.compress(b'{"a": 1}', mtime=0), b"}", b"}"))
+        self.assertIsNone(gzip_splice.splice(b"", gzip_splice.compress(b"[1]"), b"}", b"}"))
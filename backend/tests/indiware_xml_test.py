@@ -0,0 +1,54 @@
+import datetime
+import unittest
+
+from .. import indiware_xml
+
+PLAN_KL = """<?xml version="1.0" encoding="utf-8"?>
+<VpMobil>
+    <Kopf>
+        <planart>K</planart>
+        <zeitstempel>08.01.2024, 07:12</zeitstempel>
+        <DatumPlan>Montag, 08. Januar 2024</DatumPlan>
+        <woche>1</woche>
+    </Kopf>
+    <FreieTage>
+        <ft>240101</ft>
+        <ft>240212</ft>
+    </FreieTage>
+    <Klassen>
+        <Kl>
+            <Kurz>5a</Kurz>
+            <Pl>
+                <Std><St>1</St><Fa>MA</Fa><Le>ABC</Le><Ra>101</Ra></Std>
+                <Std><St>2</St><Fa>DE</Fa><Le>DEF</Le><Ra>102</Ra></Std>
+            </Pl>
+        </Kl>
+        <Kl>
+            <Kurz>5b</Kurz>
+            <Pl>
+                <Std><St>1</St><Fa>EN</Fa><Le>GHI</Le><Ra>103</Ra></Std>
+            </Pl>
+        </Kl>
+    </Klassen>
+</VpMobil>
+"""
+
+
+class TestIndiwareXml(unittest.TestCase):
+    def test_read_free_days(self):
+        self.assertEqual(
+            indiware_xml.read_free_days(PLAN_KL),
+            [datetime.date(2024, 1, 1), datetime.date(2024, 2, 12)]
+        )
+        self.assertEqual(
+            indiware_xml.read_free_days("<vp><kopf/><freietage><ft>240101</ft></freietage></vp>"),
+            [datetime.date(2024, 1, 1)]
+        )
+        self.assertEqual(indiware_xml.read_free_days("<vp><kopf/></vp>"), [])
+
+    def test_iter_elements(self):
+        # elements are detached, not cleared, so they stay usable
+        lessons = list(indiware_xml.iter_elements(PLAN_KL, "Std"))
+
+        self.assertEqual([lesson.findtext("Fa") for lesson in lessons], ["MA", "DE", "EN"])
+        self.assertEqual([form.findtext("Kurz") for form in indiware_xml.iter_elements(PLAN_KL, "kl")], ["5a", "5b"])
@@ -0,0 +1,58 @@
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+
+from shared.cache import Cache
+from ..plan_processor import PlanProcessor
+from ..blocks import BlockConfiguration
+
+
+class TestArtifactFingerprints(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.plan_processor = PlanProcessor(Cache(Path(self._tmp_dir.name)), "00000000",
+                                            logger=logging.getLogger("test"))
+        self.plan_processor.block_config = BlockConfiguration({})
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def manifest(self, fingerprints: dict[str, str]) -> dict:
+        return {
+            "versions": PlanProcessor.ARTIFACT_VERSIONS,
+            "artifacts": {
+                filename: {"version": PlanProcessor.ARTIFACT_VERSIONS[filename], "inputs": fingerprint}
+                for filename, fingerprint in fingerprints.items()
+            }
+        }
+
+    def test_changed_rooms(self):
+        inputs = dict(plan_kl="<VpMobil/>", vplan_kl=None, plan_le="<VpMobil/>", plan_ra=None, all_forms=["5a"])
+        manifest = self.manifest(self.plan_processor.input_fingerprints(**inputs, all_rooms={"101"}))
+
+        fingerprints = self.plan_processor.input_fingerprints(**inputs, all_rooms={"101", "102"})
+
+        self.assertEqual(
+            self.plan_processor.outdated_artifacts(manifest, fingerprints, has_teachers_plan=True),
+            {
+                "rooms.json", "info.json", "plan_response.json",
+                "rooms.teachers.json", "info.teachers.json", "plan_response.teachers.json"
+            }
+        )
+        self.assertEqual(
+            self.plan_processor.outdated_artifacts(manifest, fingerprints, has_teachers_plan=False),
+            {"rooms.json", "info.json", "plan_response.json"}
+        )
+
+    def test_bumped_version(self):
+        inputs = dict(plan_kl="<VpMobil/>", vplan_kl=None, plan_le=None, plan_ra=None, all_rooms={"101"},
+                      all_forms=["5a"])
+        fingerprints = self.plan_processor.input_fingerprints(**inputs)
+        manifest = self.manifest(fingerprints)
+        manifest["artifacts"]["statistics.json"]["version"] = "0"
+
+        self.assertEqual(
+            self.plan_processor.outdated_artifacts(manifest, fingerprints, has_teachers_plan=False),
+            {"statistics.json"}
+        )
@@ -0,0 +1,35 @@
+import datetime
+import unittest
+
+from ..poll_scheduler import PollingScheduler
+
+
+class TestPollingScheduler(unittest.TestCase):
+    def test_intervals_within_bounds(self):
+        scheduler = PollingScheduler(max_factor=6, jitter=0.1)
+
+        for hour in range(24):
+            interval = scheduler.next_interval(300, now=datetime.datetime(2024, 1, 8, hour))
+            self.assertGreaterEqual(interval, 300 * 0.9)
+            self.assertLessEqual(interval, 300 * 6 * 1.1)
+
+    def test_learns_upload_times(self):
+        scheduler = PollingScheduler(max_factor=6, jitter=0)
+        monday_night = datetime.datetime(2024, 1, 8, 2)
+
+        self.assertGreater(scheduler.next_interval(300, now=monday_night), 300 * 3)
+
+        for week in range(10):
+            scheduler.record_upload(monday_night + datetime.timedelta(weeks=week))
+
+        self.assertEqual(scheduler.next_interval(300, now=monday_night), 300)
+
+    def test_free_days_back_off(self):
+        scheduler = PollingScheduler(max_factor=6, jitter=0)
+        monday_morning = datetime.datetime(2024, 1, 8, 7)
+
+        for week in range(10):
+            scheduler.record_upload(monday_morning - datetime.timedelta(weeks=week + 1))
+
+        self.assertEqual(scheduler.next_interval(300, now=monday_morning), 300)
+        self.assertGreater(scheduler.next_interval(300, free_days={monday_morning.date()}, now=monday_morning), 300)
@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+
+from ..request_budget import RequestBudget
+
+
+class TestRequestBudget(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrency_limits(self):
+        budget = RequestBudget(max_concurrent=3, requests_per_second=1000, max_concurrent_per_host=2)
+        active: dict[str, int] = {"a": 0, "b": 0}
+        max_active = {"total": 0, "a": 0, "b": 0}
+
+        async def request(school: str, host: str):
+            async with budget.acquire(school, host):
+                active[host] += 1
+                max_active["total"] = max(max_active["total"], sum(active.values()))
+                max_active[host] = max(max_active[host], active[host])
+                await asyncio.sleep(0.01)
+                active[host] -= 1
+
+        await asyncio.gather(*(request(f"school{i % 4}", "ab"[i % 2]) for i in range(20)))
+
+        self.assertEqual(max_active["total"], 3)
+        self.assertEqual(max_active["a"], 2)
+        self.assertEqual(max_active["b"], 2)
+
+    async def test_fair_between_schools(self):
+        budget = RequestBudget(max_concurrent=1, requests_per_second=1000)
+        order = []
+
+        async def request(school: str):
+            async with budget.acquire(school, "host"):
+                order.append(school)
+                await asyncio.sleep(0)
+
+        # school "a" queues a large backlog first
+        await asyncio.gather(*[request("a") for _ in range(5)], *[request("b") for _ in range(2)])
+
+        self.assertEqual(order[:5], ["a", "a", "b", "a", "b"])
+
+    async def test_cancelled_waiter_is_removed(self):
+        budget = RequestBudget(max_concurrent=1, requests_per_second=1000)
+        release = asyncio.Event()
+
+        async def blocker():
+            async with budget.acquire("a", "host"):
+                await release.wait()
+
+        blocking = asyncio.create_task(blocker())
+        await asyncio.sleep(0)
+
+        waiting = asyncio.create_task(blocker())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+        release.set()
+        await blocking
+
+        async with budget.acquire("b", "host"):
+            pass
+
+    async def test_waiter_cancelled_before_cleanup(self):
+        budget = RequestBudget(max_concurrent=1, requests_per_second=1e12)
+
+        holding = budget.acquire("a", "host")
+        await holding.__aenter__()
+
+        async def waiter():
+            async with budget.acquire("b", "host"):
+                pass
+
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+
+        # the waiter's future is cancelled now, but its cleanup only runs once the task resumes
+        waiting.cancel()
+        await holding.__aexit__(None, None, None)
+
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+        self.assertEqual(budget._active, 0)
+        self.assertEqual(budget._active_per_host["host"], 0)
+
+        async with budget.acquire("c", "host"):
+            self.assertEqual(budget._active, 1)
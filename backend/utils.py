@@ -1,15 +1,117 @@
 import argparse
 import asyncio
+import concurrent.futures
 import datetime
 import logging
+import multiprocessing
+import time
 from pathlib import Path
 
-import stundenplan24_py.indiware_mobil
-from backend import meta_extractor
-from backend.load_plans import get_crawlers
+from backend import indiware_xml, meta_extractor
+from backend.load_plans import PlanCrawler, get_crawlers
+from backend.plan_processor import migrate_plan_revision_in_worker, init_worker_logging, worker_logging_initargs
 from shared import cache
 
 
+def migrate_all_plans(crawlers: dict[str, PlanCrawler], *, school_numbers: list[str], since: datetime.date | None,
+                      just_newest_revision: bool, force: bool, jobs: int):
+    logger = logging.getLogger("migrate-all")
+
+    # school number -> (day, revision), in a deterministic order
+    revisions: dict[str, list[tuple[datetime.date, datetime.datetime]]] = {}
+
+    for school_number in sorted(crawlers):
+        if school_numbers and school_number not in school_numbers:
+            continue
+
+        school_cache = crawlers[school_number].plan_processor.cache
+        revisions[school_number] = []
+
+        for day in school_cache.get_days():
+            if since is not None and day < since:
+                continue
+
+            school_cache.update_newest(day)
+
+            timestamps = school_cache.get_timestamps(day)
+            for revision in timestamps[:1] if just_newest_revision else timestamps:
+                revisions[school_number].append((day, revision))
+
+    total = sum(map(len, revisions.values()))
+    done = 0
+    migrated = 0
+    failed = 0
+    start = time.monotonic()
+
+    def report_progress():
+        if done % 100 != 0 and done != total:
+            return
+
+        elapsed = time.monotonic() - start
+        remaining = elapsed / done * (total - done) if done else 0
+        logger.info(f"=> {done}/{total} revisions done ({migrated} migrated, {failed} failed). "
+                    f"Elapsed: {elapsed:.0f} s, remaining: ~{remaining:.0f} s.")
+
+    logger.info(f"* Migrating {total} revisions of {len(revisions)} schools using {jobs} process(es)...")
+
+    if jobs == 1:
+        for school_number, school_revisions in revisions.items():
+            plan_processor = crawlers[school_number].plan_processor
+
+            for day, revision in school_revisions:
+                try:
+                    migrated += plan_processor.migrate_plan_revision(day, revision, force)
+                except Exception:
+                    plan_processor._logger.error(f"Failed to migrate plans for {day!s} {revision!s}.", exc_info=True)
+                    failed += 1
+
+                done += 1
+                report_progress()
+    else:
+        # (school number, day, revision) -> teachers found by the worker
+        added_teachers: dict[tuple[str, datetime.date, datetime.datetime], list] = {}
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                    mp_context=multiprocessing.get_context("spawn"),
+                                                    initializer=init_worker_logging,
+                                                    initargs=worker_logging_initargs()) as executor:
+            futures = {
+                executor.submit(
+                    migrate_plan_revision_in_worker, crawlers[school_number].plan_processor.cache.path,
+                    school_number, day, revision, crawlers[school_number].plan_processor.block_config, force
+                ): (school_number, day, revision)
+                for school_number, school_revisions in revisions.items()
+                for day, revision in school_revisions
+            }
+
+            for future in concurrent.futures.as_completed(futures):
+                school_number, day, revision = futures[future]
+                try:
+                    did_migrate, added_teachers[school_number, day, revision] = future.result()
+                except Exception:
+                    crawlers[school_number].plan_processor._logger.error(
+                        f"Failed to migrate plans for {day!s} {revision!s}.", exc_info=True
+                    )
+                    failed += 1
+                else:
+                    migrated += did_migrate
+
+                done += 1
+                report_progress()
+
+        # jobs complete in any order, add their teachers in a fixed one
+        for school_number, day, revision in sorted(added_teachers):
+            crawlers[school_number].plan_processor.teachers.add_teachers(
+                *added_teachers[school_number, day, revision]
+            )
+
+    # workers only read teachers, so teachers and meta data are updated here, once per school and in a fixed order
+    for school_number in revisions:
+        plan_processor = crawlers[school_number].plan_processor
+        plan_processor.meta_extractor.invalidate_cache()
+        plan_processor.update_after_plan_processing()
+
+
 async def main():
     logging.basicConfig(level="DEBUG", format="[%(asctime)s] [%(levelname)8s] %(name)s: %(message)s",
                         datefmt="%Y-%m-%d %H:%M:%S")
@@ -23,6 +125,12 @@ async def main():
     migrate_all.add_argument("--school-number", action="append", help="Only migrate plans for this school number.",
                              default=[])
     migrate_all.add_argument("--just-newest-revision", action="store_true", help="Only migrate the newest revision.")
+    migrate_all.add_argument("--force", action="store_true",
+                             help="Also check revisions that were already processed with the current versions and "
+                                  "recompute their artifacts whose inputs changed. Without this, an interrupted "
+                                  "migration resumes where it stopped.")
+    migrate_all.add_argument("--jobs", "-j", type=int, default=1,
+                             help="Number of processes to migrate revisions in parallel.")
 
     extract_all_teachers = subparsers.add_parser("extract-all-teachers")
 
@@ -35,6 +143,11 @@ async def main():
 
     clean_cache = subparsers.add_parser("clean-cache", description="Remove technically redundant .json-files from the cache.")
 
+    deduplicate_cache = subparsers.add_parser(
+        "deduplicate-cache",
+        description="Move plan files of all revisions into the content-addressed blob store and remove unused blobs."
+    )
+
     clean_teachers = subparsers.add_parser("clean-teachers")
 
     get_all_additional_infos = subparsers.add_parser("get-all-additional-infos")
@@ -46,24 +159,8 @@ async def main():
     if args.subcommand == "migrate-all":
         since = datetime.datetime.strptime(args.since, "%Y-%m-%d").date() if args.since else None
 
-        for crawler in crawlers.values():
-            if args.school_number and crawler.school_number not in args.school_number:
-                continue
-
-            for day in crawler.plan_processor.cache.get_days():
-                if since is not None and day < since:
-                    continue
-
-                crawler.plan_processor.cache.update_newest(day)
-
-                for revision in crawler.plan_processor.cache.get_timestamps(day):
-                    crawler.plan_processor._logger.info(f"Computing plans for {day} {revision}...")
-                    crawler.plan_processor.compute_plan_revision(day, revision)
-
-                    if args.just_newest_revision:
-                        break
-
-            crawler.plan_processor.update_after_plan_processing()
+        migrate_all_plans(crawlers, school_numbers=args.school_number, since=since,
+                          just_newest_revision=args.just_newest_revision, force=args.force, jobs=args.jobs)
 
     elif args.subcommand == "extract-all-teachers":
         logging.basicConfig(level="DEBUG", format="[%(asctime)s] [%(levelname)8s] %(name)s: %(message)s",
@@ -72,18 +169,15 @@ async def main():
         for crawler in crawlers.values():
             crawler.plan_processor._logger.info("Extracting teachers...")
 
-            class NullDict(dict):
-                def __setitem__(self, key, value):
-                    date, rev = key
-                    crawler.plan_processor._logger.info(f"Date: {date!s} Revision: {rev!s}")
-
+            # don't keep all parsed plans in memory
             extractor = meta_extractor.MetaExtractor(
                 cache=crawler.plan_processor.cache,
                 num_last_days=None,
-                logger=crawler.plan_processor._logger
+                logger=crawler.plan_processor._logger,
+                cache_extractors=False
             )
-            extractor._daily_extractors = NullDict()
-            crawler.plan_processor.teachers.add_teachers(*extractor.teachers())
+            sightings, _ = extractor.teacher_sightings()
+            crawler.plan_processor.teachers.add_sightings(sightings)
             crawler.plan_processor.store_teachers()
 
     elif args.subcommand == "import-plank-files":
@@ -173,9 +267,15 @@ async def main():
                             print(f"=> Removing {file!s}")
                             file.unlink(missing_ok=True)
 
-    elif args.subcommand == "get-all-additional-infos":
-        from xml.etree import ElementTree as ET
+            print(f"=> Removed {crawler.plan_processor.cache.collect_garbage()} unused blobs.")
+
+    elif args.subcommand == "deduplicate-cache":
+        for crawler in crawlers.values():
+            print(f"=> {crawler.school_number!r}")
+            print(f" -> Deduplicated {crawler.plan_processor.cache.deduplicate_plan_files()} files.")
+            print(f" -> Removed {crawler.plan_processor.cache.collect_garbage()} unused blobs.")
 
+    elif args.subcommand == "get-all-additional-infos":
         for crawler in crawlers.values():
             out = set()
             for day in crawler.plan_processor.cache.get_days():
@@ -186,11 +286,10 @@ async def main():
                     except FileNotFoundError:
                         continue
 
-                    tree = ET.fromstring(xml_file)
-
-                    p = stundenplan24_py.indiware_mobil.IndiwareMobilPlan.from_xml(tree)
+                    # only the additional info is needed, so don't parse the whole plan
+                    additional_info = [line.text for line in indiware_xml.iter_elements(xml_file, "ZiZeile")]
 
-                out.update("\n".join(x for x in p.additional_info if x is not None).split("\n\n"))
+                out.update("\n".join(x for x in additional_info if x is not None).split("\n\n"))
 
             print("\n\n".join(sorted(out)))
 
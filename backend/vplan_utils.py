@@ -297,3 +297,9 @@ def get_future_week(holidays: list[datetime.date], weeks: int, ref_date: datetim
         curr_date += datetime.timedelta(days=1)
 
     return curr_week_i + 1
+
+
+def plan_response_data(info: str, rooms: str, plans: str, exams: str) -> str:
+    """Assemble the data of a /plan response from the already serialized JSON files of a revision, without parsing
+    them."""
+    return f'{{"info": {info}, "rooms": {rooms}, "plans": {plans}, "exams": {exams}, "is_default_plan": false}}'
@@ -100,10 +100,7 @@ export function load_plan(
     let curr_time = new Date();
     if(!last_updated_handler(date, false) || curr_time - last_updated_handler(date, false) > 30_000) {
         // Try to load from network
-        let params = new URLSearchParams();
-        params.append("date", date);
-        params.append("revision", revision);
-        customFetch(`${api_base}/plan?${params.toString()}`, {signal: signal})
+        fetch_plan(api_base, date, revision, signal)
             .then(data => {
                 if (Object.keys(data).length !== 0 && revision === ".newest" && !data.is_default_plan) {
                     cache_plan(school_num, date, data, () => {
@@ -134,6 +131,54 @@ export function load_plan(
     }
 }
 
+// must match MAX_PLANS_PER_REQUEST of the /plans endpoint
+const MAX_PLANS_PER_REQUEST = 14;
+// api_base -> newest plans requested in the current tick, e.g. by all days of the week view
+let pending_plan_batches = {};
+
+function fetch_plan(api_base, date, revision, signal) {
+    if (revision !== ".newest") {
+        let params = new URLSearchParams();
+        params.append("date", date);
+        params.append("revision", revision);
+        return customFetch(`${api_base}/plan?${params.toString()}`, {signal: signal});
+    }
+
+    let batch = pending_plan_batches[api_base];
+    if (!batch || batch.dates.size >= MAX_PLANS_PER_REQUEST) {
+        batch = {dates: new Set()};
+        pending_plan_batches[api_base] = batch;
+        batch.promise = Promise.resolve().then(() => {
+            if (pending_plan_batches[api_base] === batch) {
+                delete pending_plan_batches[api_base];
+            }
+            let params = new URLSearchParams();
+            if (batch.dates.size === 1) {
+                // /plan can send the stored compressed response as-is
+                const [single_date] = batch.dates;
+                params.append("date", single_date);
+                return customFetch(`${api_base}/plan?${params.toString()}`)
+                    .then(data => ({[single_date]: data}));
+            }
+            params.append("dates", [...batch.dates].join(","));
+            return customFetch(`${api_base}/plans?${params.toString()}`);
+        });
+    }
+    batch.dates.add(date);
+
+    // the batch is shared, so aborting only detaches this caller from it
+    return new Promise((resolve, reject) => {
+        signal?.addEventListener("abort", () => reject(new DOMException("The request was aborted.", "AbortError")));
+        batch.promise.then(plans => {
+            if (plans[date] === null) {
+                reject(new Error("Für diesen Tag ist kein Plan verfügbar."));
+            } else {
+                resolve(plans[date]);
+            }
+        }, reject);
+    });
+}
+
 export function gen_location_hash(location_name, school_num, date, plan_type, plan_value) {
     if(school_num && date && plan_type) {
         return `${location_name}|${school_num}|${date}|${plan_type}|${plan_value}`;
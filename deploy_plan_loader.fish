@@ -30,7 +30,7 @@ end
 
 # Start the plan loader
 echo "=> Starting plan loader..."
-nohup venv/bin/python3 -m backend.load_plans --ignore-exceptions --never-raise-out-of-proxies -l DEBUG -i 300 > nohup.out2 2> nohup.out < /dev/null &
+nohup venv/bin/python3 -m backend.load_plans --ignore-exceptions --never-raise-out-of-proxies -l DEBUG -i 60 > nohup.out2 2> nohup.out < /dev/null &
 
 # Disown the process
 echo "=> Disowning..."
@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import random
 from typing import List
@@ -16,6 +17,7 @@ from endpoints.authorization import school_authorized
 import endpoints.webpush
 
 import shared.cache
+from shared import gzip_splice
 from backend import vplan_utils
 from utils import send_success, send_error, get_all_schools, get_school_by_id, webhook_send, BetterEmbed, VALID_SCHOOLS
 from school_test import SchoolCandidate
@@ -37,6 +39,25 @@ def schools() -> Response:
 API_BASE_URL = "/api/v69.420/<school_num>"
 
 
+def make_etag(*parts) -> str:
+    return hashlib.sha1("\0".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+
+def is_not_modified(etag: str) -> bool:
+    """Whether the client already has the representation with the given ETag."""
+    if_none_match = request.if_none_match
+    # Flask-Compress appends the content encoding to the ETags of compressed responses
+    return if_none_match.star_tag or any(
+        tag == etag or tag.startswith(f"{etag}:") for tag in if_none_match.as_set(include_weak=True)
+    )
+
+
+def send_not_modified(etag: str) -> Response:
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
 @api.route(f"{API_BASE_URL}/meta", methods=["GET"], endpoint="meta_api")
 @login_required
 @school_authorized
@@ -45,6 +66,42 @@ def meta(school_num) -> Response:
         return send_error("Schulnummer unbekannt")
 
     cache: shared.cache.Cache = shared.cache.Cache(Path(".cache") / school_num)
+
+    now = datetime.datetime.now()
+    etag = make_etag(
+        school_num,
+        # inputs of find_closest_date
+        now.date(), now.hour < 17,
+        *(cache.get_meta_file_mtime(file)
+          for file in ("meta.json", "teachers.json", "forms.json", "rooms.json", "dates.json"))
+    )
+    if is_not_modified(etag):
+        return send_not_modified(etag)
+
+    cached_etag, body, encoded_bodies = _META_RESPONSES.get(school_num, (None, None, None))
+    if cached_etag != etag:
+        body = json.dumps({"success": True, "data": get_meta_data(cache, school_num)}).encode("utf-8")
+        encoded_bodies = {}
+        _META_RESPONSES[school_num] = etag, body, encoded_bodies
+
+    for encoding in utils.accepted_encodings():
+        if encoding not in encoded_bodies:
+            encoded_bodies[encoding] = shared.cache.ENCODINGS[encoding][1](body)
+
+        response = utils.send_encoded(encoded_bodies[encoding], encoding)
+        response.set_etag(f"{etag}:{encoding}")
+        return response
+
+    response = utils.send_encoded(body)
+    response.set_etag(etag)
+    return response
+
+
+# school_num -> (etag, serialized response, {content encoding: compressed response})
+_META_RESPONSES: dict[str, tuple[str, bytes, dict[str, bytes]]] = {}
+
+
+def get_meta_data(cache: shared.cache.Cache, school_num: str) -> dict:
     meta_data: dict = json.loads(cache.get_meta_file("meta.json"))
     teachers_data: dict = json.loads(cache.get_meta_file("teachers.json"))["teachers"]
     forms_data: dict = json.loads(cache.get_meta_file("forms.json"))
@@ -54,7 +111,7 @@ def meta(school_num) -> Response:
     dates = sorted([datetime.datetime.strptime(elem, "%Y-%m-%d").date() for elem in list(dates_data.keys())])
     date = vplan_utils.find_closest_date(dates)
 
-    return send_success({
+    return {
         "school_num": school_num,
         "meta": meta_data,
         "teachers": teachers_data,
@@ -62,7 +119,7 @@ def meta(school_num) -> Response:
         "rooms": rooms_data,
         "dates": dates_data,
         "date": date.strftime("%Y-%m-%d") if date else None
-    })
+    }
 
 
 @api.route(f"{API_BASE_URL}/plan", methods=["GET"], endpoint="plan_api")
@@ -90,44 +147,159 @@ def plan(school_num: str) -> Response:
     except ValueError:
         return send_error("Invalid revision timestamp format. Must be in ISO format.")
 
+    etag = plan_etag(cache, school_num, date, revision)
+    if is_not_modified(etag):
+        return send_not_modified(etag)
+
+    last_fetch = get_last_fetch(cache)
+
+    if "gzip" in utils.accepted_encodings():
+        response = send_compressed_plan_response(cache, date, revision, last_fetch)
+        if response is not None:
+            response.set_etag(f"{etag}:gzip")
+            return response
+
     try:
-        data = {
-            "info": json.loads(cache.get_plan_file(date, revision, "info.json")),
-            "rooms": json.loads(cache.get_plan_file(date, revision, "rooms.json")),
-            "plans": json.loads(cache.get_plan_file(date, revision, "plans.json")),
-            "exams": json.loads(cache.get_plan_file(date, revision, "exams.json")),
-            "is_default_plan": False
-        }
+        data = get_day_plan_data(cache, date, revision, DefaultPlanPredictor(cache))
+    except PlanUnavailableError as e:
+        return send_error(e.args[0])
+
+    response = utils.send_encoded(
+        b'{"success": true, "data": ' + add_json_field(data, "last_fetch", last_fetch) + b'}'
+    )
+    response.set_etag(etag)
+    return response
+
+
+def send_compressed_plan_response(cache: shared.cache.Cache, date: datetime.date, revision: datetime.datetime | str,
+                                  last_fetch: str | None) -> Response | None:
+    """Send the stored, gzip-compressed plan_response.json of a revision with last_fetch added, without decompressing
+    it. Returns None if the revision has no such file, e.g. because it was processed before it was compressed."""
+    try:
+        data, encoding = cache.get_plan_file_bytes(date, revision, "plan_response.json", accept_encodings=["gzip"])
     except FileNotFoundError:
-        # use default plan
+        return None
 
-        if revision != ".newest":
-            return send_error("Only valid timestamp for predicted default plans is '.newest'.")
+    if encoding != "gzip":
+        return None
+
+    body = gzip_splice.splice(b'{"success": true, "data": ', data, b"}", json_field("last_fetch", last_fetch) + b"}}")
+    if body is None:
+        return None
+
+    return utils.send_encoded(body, "gzip")
+
+
+MAX_PLANS_PER_REQUEST = 14
+
+
+@api.route(f"{API_BASE_URL}/plans", methods=["GET"], endpoint="plans_api")
+@login_required
+@school_authorized
+def plans(school_num: str) -> Response:
+    """Batched version of /plan for multiple days, e.g. a week view. Takes either a comma separated list of dates
+    (dates) or an inclusive range (start, end). Maps each date to the data /plan would return for it, or to null if
+    no plan is available."""
+    if school_num not in VALID_SCHOOLS:
+        return send_error("Schulnummer unbekannt")
+
+    cache = shared.cache.Cache(Path(".cache") / school_num)
+
+    try:
+        if _dates := request.args.get("dates"):
+            dates = [datetime.datetime.strptime(elem, "%Y-%m-%d").date() for elem in _dates.split(",")]
+        elif (_start := request.args.get("start")) and (_end := request.args.get("end")):
+            start = datetime.datetime.strptime(_start, "%Y-%m-%d").date()
+            end = datetime.datetime.strptime(_end, "%Y-%m-%d").date()
+            if end < start:
+                return send_error("end must not be before start.")
+            dates = [start + datetime.timedelta(days=i) for i in range(min((end - start).days + 1,
+                                                                             MAX_PLANS_PER_REQUEST + 1))]
+        else:
+            return send_error("Missing dates or start and end url parameters (YYYY-MM-DD).")
+    except ValueError:
+        return send_error("Invalid date format. Must be YYYY-MM-DD.")
+
+    dates = sorted(set(dates))
+    if len(dates) > MAX_PLANS_PER_REQUEST:
+        return send_error(f"Too many dates. At most {MAX_PLANS_PER_REQUEST} are allowed.")
+
+    etag = make_etag(*(plan_etag(cache, school_num, date, ".newest") for date in dates))
+    if is_not_modified(etag):
+        return send_not_modified(etag)
 
-        holidays = list(map(datetime.date.fromisoformat, json.loads(cache.get_meta_file("meta.json"))["free_days"]))
-        default_plan_data = json.loads(cache.get_meta_file("default_plan.json"))
+    last_fetch = get_last_fetch(cache)
+    default_plan_predictor = DefaultPlanPredictor(cache)
 
-        newest_date = cache.get_days()[0]
+    plans_data = []
+    for date in dates:
         try:
-            newest_date_week = json.loads(cache.get_plan_file(newest_date, ".newest", "_default_plan.json"))["week"]
-        except FileNotFoundError:
+            data = add_json_field(
+                get_day_plan_data(cache, date, ".newest", default_plan_predictor), "last_fetch", last_fetch
+            )
+        except PlanUnavailableError:
+            data = b"null"
+
+        plans_data.append(f'"{date.isoformat()}": '.encode("utf-8") + data)
+
+    response = utils.send_encoded(b'{"success": true, "data": {' + b", ".join(plans_data) + b'}}')
+    response.set_etag(etag)
+    return response
+
+
+class PlanUnavailableError(Exception):
+    pass
+
+
+class DefaultPlanPredictor:
+    """Predicts the plans of days without stored revisions from the default plan. Its inputs are only loaded once and
+    only when needed, so it can be shared by all days of a request."""
+
+    def __init__(self, cache: shared.cache.Cache):
+        self.cache = cache
+        self._loaded = False
+
+    def _load(self):
+        self._loaded = True
+
+        try:
+            self.holidays = list(map(
+                datetime.date.fromisoformat, json.loads(self.cache.get_meta_file("meta.json"))["free_days"]
+            ))
+            self.default_plan_data = json.loads(self.cache.get_meta_file("default_plan.json"))
+
+            self.newest_date = self.cache.get_days()[0]
+            self.newest_date_week = json.loads(
+                self.cache.get_plan_file(self.newest_date, ".newest", "_default_plan.json")
+            )["week"]
+        except (FileNotFoundError, IndexError):
+            # nothing processed yet, or the newest revision has no default plan
             # TODO temporary fix oops, use newest _default_plan.json instead
-            return send_error("No default plan available for this date.")
+            self.available = False
+        else:
+            self.available = True
+
+    def predict(self, date: datetime.date) -> bytes:
+        if not self._loaded:
+            self._load()
+
+        if not self.available:
+            raise PlanUnavailableError("No default plan available for this date.")
 
         week = vplan_utils.get_future_week(
-            holidays=holidays,
-            weeks=len(default_plan_data),
-            ref_date=newest_date,
-            ref_week=newest_date_week,
+            holidays=self.holidays,
+            weeks=len(self.default_plan_data),
+            ref_date=self.newest_date,
+            ref_week=self.newest_date_week,
             date=date
         )
         try:
-            plans = default_plan_data[str(week) if week is not None else "null"][str(date.weekday())]
+            plans = self.default_plan_data[str(week) if week is not None else "null"][str(date.weekday())]
         except KeyError:
             # raise
-            return send_error("No default plan available for this date.")
+            raise PlanUnavailableError("No default plan available for this date.")
 
-        data = {
+        return json.dumps({
             "info": {
                 "additional_info": [],
                 "processed_additional_info": [],
@@ -138,11 +310,87 @@ def plan(school_num: str) -> Response:
             "plans": plans,
             "exams": {},
             "is_default_plan": True
-        }
+        }).encode("utf-8")
+
+
+def get_day_plan_data(cache: shared.cache.Cache, date: datetime.date, revision: datetime.datetime | str,
+                      default_plan_predictor: DefaultPlanPredictor) -> bytes:
+    """Return the serialized data of a /plan response (without last_fetch) for a day. Falls back to predicting the
+    plan from the default plan if no revision is stored."""
+    try:
+        return get_plan_response_data(cache, date, revision)
+    except FileNotFoundError:
+        if revision != ".newest":
+            raise PlanUnavailableError("Only valid timestamp for predicted default plans is '.newest'.")
+
+        return default_plan_predictor.predict(date)
+
+
+def plan_etag(cache: shared.cache.Cache, school_num: str, date: datetime.date,
+              revision: datetime.datetime | str) -> str:
+    """Return the ETag of a /plan response. Revisions are immutable once processed, so only reprocessing and new
+    fetches (last_fetch is part of the response) change it."""
+    last_fetch_mtime = get_meta_file_mtime(cache, "last_fetch.json")
+
+    try:
+        resolved_revision = cache.resolve_timestamp(date, revision)
+        if cache.plan_file_exists(date, resolved_revision, "info.json"):
+            return make_etag(
+                school_num, date, resolved_revision,
+                cache.get_plan_file_mtime(date, resolved_revision, ".processed"),
+                last_fetch_mtime
+            )
+    except FileNotFoundError:
+        pass
+
+    # default plan
+    return make_etag(
+        school_num, date, None,
+        get_meta_file_mtime(cache, "default_plan.json"),
+        get_meta_file_mtime(cache, "meta.json"),
+        next(iter(cache.get_days()), None),
+        last_fetch_mtime
+    )
+
+
+def get_meta_file_mtime(cache: shared.cache.Cache, filename: str) -> int | None:
+    try:
+        return cache.get_meta_file_mtime(filename)
+    except FileNotFoundError:
+        return None
+
+
+def get_last_fetch(cache: shared.cache.Cache) -> str | None:
+    try:
+        return json.loads(cache.get_meta_file("last_fetch.json"))["timestamp"]
+    except FileNotFoundError:
+        return None
+
+
+def get_plan_response_data(cache: shared.cache.Cache, date: datetime.date, revision: datetime.datetime | str) -> bytes:
+    """Return the serialized data of a /plan response for a stored revision."""
+    try:
+        data, _ = cache.get_plan_file_bytes(date, revision, "plan_response.json")
+    except FileNotFoundError:
+        # revision was processed before plan_response.json existed
+        data = vplan_utils.plan_response_data(
+            info=cache.get_plan_file(date, revision, "info.json"),
+            rooms=cache.get_plan_file(date, revision, "rooms.json"),
+            plans=cache.get_plan_file(date, revision, "plans.json"),
+            exams=cache.get_plan_file(date, revision, "exams.json"),
+        ).encode("utf-8")
+
+    return data
+
+
+def json_field(key: str, value) -> bytes:
+    """Serialize a field to be appended to the fields of a JSON object, including the separating comma."""
+    return f', {json.dumps(key)}: {json.dumps(value)}'.encode("utf-8")
 
-    data["last_fetch"] = json.loads(cache.get_meta_file("last_fetch.json"))["timestamp"]
 
-    return send_success(data)
+def add_json_field(json_object: bytes, key: str, value) -> bytes:
+    """Add a field to a serialized JSON object without parsing it."""
+    return json_object.rstrip()[:-1] + json_field(key, value) + b"}"
 
 
 @api.route(f"/api/v69.420/plan_ical/<token>", methods=["GET"])
@@ -101,6 +101,7 @@ def account() -> Response:
         # embed.set_timestamp()
         webhook_send("WEBHOOK_USER_CREATION", "", embeds=[embed])
         x = users.delete_one({'_id': ObjectId(current_user.mongo_id)})
+        current_user.invalidate()
         return send_success() if x.deleted_count == 1 else send_error(
             "Account konnte nicht gelöscht werden, bitte wende dich an den Support"
         )
@@ -69,7 +69,7 @@ def user_loader(user_id: str) -> User | None:
     tmp_user = get_user(user_id)
     if tmp_user is None:
         return
-    tmp_user = User(user_id)
+    tmp_user = User(user_id, tmp_user)
     return tmp_user
 
 
@@ -1,12 +1,178 @@
 from __future__ import annotations
 
+import bisect
 import datetime
+import gzip
+import hashlib
+import io
+import os
+import threading
+import typing
 from pathlib import Path
 
+from shared import gzip_splice
+
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H-%M-%S"
+
+
+def _temp_path(path: Path) -> Path:
+    """Path of a temporary file to write before atomically replacing path, unique per process and thread."""
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _brotli():
+    import brotlicffi
+    return brotlicffi
+
+
+# content encoding: (file suffix, compress, decompress)
+ENCODINGS = {
+    # members are laid out so the web server can append to stored JSON objects, see gzip_splice
+    "gzip": (".gz", gzip_splice.compress, gzip.decompress),
+    "br": (".br", lambda data: _brotli().compress(data), lambda data: _brotli().decompress(data)),
+}
+
+# filename -> content encoding
+# large and redundant files that are read far more often than they are written
+DEFAULT_COMPRESSION: dict[str, str] = {
+    "plans.json": "gzip",
+    "plans.teachers.json": "gzip",
+    "default_plan.json": "gzip",
+    "plan_response.json": "gzip",
+    "plan_response.teachers.json": "gzip",
+}
+
+
+class _RevisionIndex:
+    """Sorted in-memory view of the days and revisions stored in a cache directory.
+
+    Listings are validated against the mtime of the containing directory, so revisions created by other processes
+    (crawler vs. web server) are picked up on the next lookup. Changes made through the owning process are applied
+    incrementally.
+    """
 
-class Cache:
     def __init__(self, path: Path):
         self.path = path
+        self._lock = threading.Lock()
+
+        # ascending
+        self._days: list[datetime.date] = []
+        self._days_mtime: int | None = None
+        self._timestamps: dict[datetime.date, list[datetime.datetime]] = {}
+        self._timestamps_mtimes: dict[datetime.date, int] = {}
+
+    @staticmethod
+    def _mtime(path: Path) -> int | None:
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def days(self) -> list[datetime.date]:
+        path = self.path / "plans"
+
+        with self._lock:
+            mtime = self._mtime(path)
+            if mtime is None:
+                return []
+
+            if mtime != self._days_mtime:
+                self._days = sorted(
+                    datetime.date.fromisoformat(elem.name)
+                    for elem in os.scandir(path) if elem.is_dir()
+                )
+                self._days_mtime = mtime
+
+            return self._days
+
+    def timestamps(self, day: datetime.date) -> list[datetime.datetime]:
+        path = self.path / "plans" / day.isoformat()
+
+        with self._lock:
+            mtime = self._mtime(path)
+            if mtime is None:
+                return []
+
+            if mtime != self._timestamps_mtimes.get(day):
+                self._timestamps[day] = sorted(
+                    datetime.datetime.strptime(elem.name, _TIMESTAMP_FORMAT).replace(tzinfo=datetime.timezone.utc)
+                    for elem in os.scandir(path) if elem.is_dir() and not elem.name.startswith(".")
+                )
+                self._timestamps_mtimes[day] = mtime
+
+            return self._timestamps[day]
+
+    @staticmethod
+    def _stat(path: Path) -> os.stat_result | None:
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def create(self, day: datetime.date, timestamp: datetime.datetime, path: Path):
+        """Create the directory of a revision and register it.
+
+        The listings are only updated incrementally if the directories' mtimes still match the indexed state and
+        their link counts prove that the new directory is the only change. Otherwise, e.g. if another process created
+        a revision at the same time, they are rebuilt on the next lookup.
+        """
+        plans_path = self.path / "plans"
+        day_path = plans_path / day.isoformat()
+
+        with self._lock:
+            plans_before, day_before = self._stat(plans_path), self._stat(day_path)
+            path.mkdir(parents=True, exist_ok=True)
+            plans_after, day_after = self._stat(plans_path), self._stat(day_path)
+
+            day_created = day_before is None
+            if (
+                plans_before is not None
+                and self._days_mtime == plans_before.st_mtime_ns
+                and plans_after.st_nlink == plans_before.st_nlink + day_created
+            ):
+                if day_created:
+                    bisect.insort(self._days, day)
+                self._days_mtime = plans_after.st_mtime_ns
+            else:
+                self._days_mtime = None
+
+            if (
+                day_before is not None
+                and day in self._timestamps
+                and self._timestamps_mtimes.get(day) == day_before.st_mtime_ns
+                and day_after.st_nlink == day_before.st_nlink + 1
+            ):
+                bisect.insort(self._timestamps[day], timestamp)
+                self._timestamps_mtimes[day] = day_after.st_mtime_ns
+            else:
+                self._timestamps_mtimes.pop(day, None)
+
+    def newest_before(self, day: datetime.date, timestamp: datetime.datetime) -> list[datetime.datetime]:
+        """Return all revisions of a day that are not newer than the given timestamp, newest first."""
+        timestamps = self.timestamps(day)
+        return timestamps[:bisect.bisect_right(timestamps, timestamp)][::-1]
+
+
+_REVISION_INDICES: dict[Path, _RevisionIndex] = {}
+_REVISION_INDICES_LOCK = threading.Lock()
+
+
+def _get_revision_index(path: Path) -> _RevisionIndex:
+    path = path.absolute()
+
+    with _REVISION_INDICES_LOCK:
+        try:
+            return _REVISION_INDICES[path]
+        except KeyError:
+            index = _REVISION_INDICES[path] = _RevisionIndex(path)
+            return index
+
+
+class Cache:
+    def __init__(self, path: Path, compression: dict[str, str] | None = None):
+        self.path = path
+        self.compression = DEFAULT_COMPRESSION if compression is None else compression
+        self._revision_index = _get_revision_index(path)
 
     def get_plan_path(self, day: datetime.date, timestamp: datetime.datetime | str | None) -> Path:
         if timestamp is None:
@@ -14,7 +180,7 @@ class Cache:
         elif isinstance(timestamp, datetime.datetime):
             return (
                 self.path / "plans" / day.isoformat()
-                / timestamp.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H-%M-%S")
+                / timestamp.astimezone(datetime.timezone.utc).strftime(_TIMESTAMP_FORMAT)
             )
         else:
             return self.path / "plans" / day.isoformat() / timestamp
@@ -23,20 +189,160 @@ class Cache:
         """Store a plan file in the cache such as "PlanKl.xml" or "rooms.json"."""
 
         path = self.get_plan_path(day, timestamp) / filename
-        path.parent.mkdir(parents=True, exist_ok=True)
 
-        temp_file_path = path.with_name(f"{path.name}.tmp")
+        if not path.parent.exists():
+            if isinstance(timestamp, datetime.datetime):
+                self._revision_index.create(
+                    day, timestamp.astimezone(datetime.timezone.utc).replace(microsecond=0), path.parent
+                )
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(temp_file_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        self._write_file(path, content, deduplicate=not filename.startswith("."))
+
+    def _file_variants(self, path: Path) -> list[tuple[Path, str | None]]:
+        """Return all paths a file may be stored at together with their content encoding, the configured one first."""
+
+        preferred_encoding = self.compression.get(path.name)
+
+        variants = [(path, None)] + [
+            (path.with_name(path.name + suffix), encoding) for encoding, (suffix, _, _) in ENCODINGS.items()
+        ]
+
+        return sorted(variants, key=lambda variant: variant[1] != preferred_encoding)
+
+    def _write_file(self, path: Path, content: str, deduplicate: bool):
+        encoding = self.compression.get(path.name)
+        data = content.encode("utf-8")
+
+        if encoding is None:
+            target_path = path
+        else:
+            suffix, compress, _ = ENCODINGS[encoding]
+            target_path = path.with_name(path.name + suffix)
+            data = compress(data)
+
+        temp_file_path = _temp_path(target_path)
+
+        if deduplicate:
+            self._link_blob(data, temp_file_path)
+        else:
+            with open(temp_file_path, "wb") as f:
+                f.write(data)
+
+        temp_file_path.rename(target_path)
+
+        # remove versions of the file stored with a different encoding
+        for variant_path, _ in self._file_variants(path):
+            if variant_path != target_path:
+                variant_path.unlink(missing_ok=True)
+
+    def _read_file(self, path: Path, accept_encodings: typing.Iterable[str] = ()) -> tuple[bytes, str | None]:
+        """Return the contents of a file and their content encoding. Contents stored with an encoding not in
+        accept_encodings are decompressed."""
+
+        for variant_path, encoding in self._file_variants(path):
+            try:
+                with open(variant_path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+
+            if encoding is not None and encoding not in accept_encodings:
+                return ENCODINGS[encoding][2](data), None
+
+            return data, encoding
+
+        raise FileNotFoundError(path)
+
+    def _file_mtime(self, path: Path) -> int:
+        for variant_path, _ in self._file_variants(path):
+            try:
+                return os.stat(variant_path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+        raise FileNotFoundError(path)
+
+    @staticmethod
+    def _decode(data: bytes) -> str:
+        # same newline handling as open() in text mode
+        return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8").read()
+
+    def _store_blob(self, content: bytes) -> Path:
+        """Store content in the content-addressed blob store and return the path of the blob."""
 
-        temp_file_path.rename(path)
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.path / "blobs" / digest[:2] / digest
+
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            temp_file_path = _temp_path(path)
+            with open(temp_file_path, "wb") as f:
+                f.write(content)
+
+            temp_file_path.replace(path)
+
+        return path
+
+    def _link_blob(self, content: bytes, path: Path):
+        """Create path as a hard link to the blob of the given content.
+
+        Revision directories only reference blobs, so byte-identical files of different revisions share their storage.
+        Falls back to a plain copy if the file system refuses the link (e.g. too many links).
+        """
+
+        path.unlink(missing_ok=True)
+
+        try:
+            os.link(self._store_blob(content), path)
+        except OSError:
+            with open(path, "wb") as f:
+                f.write(content)
+
+    def deduplicate_plan_files(self) -> int:
+        """Replace plain plan files of all revisions with links into the blob store. Return the number of replaced
+        files."""
+
+        replaced = 0
+
+        for day in self.get_days():
+            for timestamp in self.get_timestamps(day):
+                for file in self.get_plan_path(day, timestamp).iterdir():
+                    if file.name.startswith(".") or file.name.endswith(".tmp") or file.stat().st_nlink > 1:
+                        continue
+
+                    temp_file_path = _temp_path(file)
+                    self._link_blob(file.read_bytes(), temp_file_path)
+                    temp_file_path.rename(file)
+                    replaced += 1
+
+        return replaced
+
+    def collect_garbage(self) -> int:
+        """Remove all blobs that are not referenced by any revision anymore. Return the number of removed blobs."""
+
+        path = self.path / "blobs"
+        if not path.exists():
+            return 0
+
+        removed = 0
+
+        for blob in path.glob("*/*"):
+            if not blob.name.endswith(".tmp") and blob.stat().st_nlink == 1:
+                blob.unlink(missing_ok=True)
+                removed += 1
+
+        return removed
 
     def remove_plan_file(self, day: datetime.date, timestamp: datetime.datetime | str, filename: str):
         """Remove a plan file from the cache."""
 
         path = self.get_plan_path(day, timestamp) / filename
-        path.unlink(missing_ok=True)
+
+        for variant_path, _ in self._file_variants(path):
+            variant_path.unlink(missing_ok=True)
 
     def get_plan_file(self,
                       day: datetime.date,
@@ -47,10 +353,7 @@ class Cache:
         # self._logger.debug(f"get_plan_file({day!r}, {timestamp!r}, {filename!r})")
 
         if newest_before and not isinstance(timestamp, str):
-            timestamps = self.get_timestamps(day)
-            timestamps = [t for t in timestamps if t <= timestamp]
-
-            for older_timestamp in timestamps:
+            for older_timestamp in self._revision_index.newest_before(day, timestamp):
                 try:
                     return self.get_plan_file(day, older_timestamp, filename, newest_before=False)
                 except OSError:
@@ -58,16 +361,29 @@ class Cache:
             else:
                 raise FileNotFoundError
         else:
-            if timestamp == ".newest":
-                try:
-                    timestamp = self.get_timestamps(day)[0]
-                except IndexError:
-                    raise FileNotFoundError
+            path = self.get_plan_path(day, self.resolve_timestamp(day, timestamp)) / filename
 
-            path = self.get_plan_path(day, timestamp) / filename
+            return self._decode(self._read_file(path)[0])
 
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read()
+    def get_plan_file_bytes(self,
+                            day: datetime.date,
+                            timestamp: datetime.datetime | str,
+                            filename: str,
+                            accept_encodings: typing.Iterable[str] = ()) -> tuple[bytes, str | None]:
+        """Return the raw contents of a plan file and their content encoding.
+
+        If the file is stored compressed with one of the accepted encodings, the compressed bytes are returned as-is so
+        they can be sent to HTTP clients without compressing them again.
+        """
+
+        path = self.get_plan_path(day, self.resolve_timestamp(day, timestamp)) / filename
+
+        return self._read_file(path, accept_encodings)
+
+    def get_plan_file_mtime(self, day: datetime.date, timestamp: datetime.datetime | str, filename: str) -> int:
+        """Return the modification time of a plan file in nanoseconds."""
+
+        return self._file_mtime(self.get_plan_path(day, self.resolve_timestamp(day, timestamp)) / filename)
 
     def store_meta_file(self, content: str, filename: str):
         """Store a meta file in the cache such as "meta.json"."""
@@ -75,69 +391,92 @@ class Cache:
         path = self.path / filename
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        temp_file_path = path.with_name(f"{path.name}.tmp")
-
-        with open(temp_file_path, "w", encoding="utf-8") as f:
-            f.write(content)
-
-        temp_file_path.rename(path)
+        self._write_file(path, content, deduplicate=False)
 
     def get_meta_file(self, filename: str) -> str:
         """Return the contents of a meta file from the cache."""
 
-        path = self.path / filename
+        return self._decode(self._read_file(self.path / filename)[0])
+
+    def get_meta_file_bytes(self,
+                            filename: str,
+                            accept_encodings: typing.Iterable[str] = ()) -> tuple[bytes, str | None]:
+        """Return the raw contents of a meta file and their content encoding. See get_plan_file_bytes."""
 
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
+        return self._read_file(self.path / filename, accept_encodings)
+
+    def get_meta_file_mtime(self, filename: str) -> int:
+        """Return the modification time of a meta file in nanoseconds."""
+
+        return self._file_mtime(self.path / filename)
 
     def get_days(self, reverse=True) -> list[datetime.date]:
         """Return a list of all days for which plans are stored."""
 
-        path = self.path / "plans"
-        if not path.exists():
-            return []
-
-        return sorted([
-            datetime.date.fromisoformat(elem.stem)
-            for elem in path.iterdir() if elem.is_dir()
-        ], reverse=reverse)
+        days = self._revision_index.days()
+        return days[::-1] if reverse else days.copy()
 
     def get_timestamps(self, day: datetime.date) -> list[datetime.datetime]:
         """Return all stored timestamps for a given day."""
 
-        path = self.get_plan_path(day, None)
+        return self._revision_index.timestamps(day)[::-1]
 
-        if not path.exists():
-            return []
+    def resolve_timestamp(self, day: datetime.date, timestamp: datetime.datetime | str) -> datetime.datetime | str:
+        """Resolve ".newest" to the name of the revision directory it points to."""
 
-        return sorted([
-            datetime.datetime.strptime(elem.stem, "%Y-%m-%dT%H-%M-%S").replace(tzinfo=datetime.timezone.utc)
-            for elem in path.iterdir() if elem.is_dir() and not elem.stem.startswith(".")
-        ], reverse=True)
+        if timestamp != ".newest":
+            return timestamp
+
+        try:
+            return self.get_plan_path(day, ".newest").read_text("utf-8")
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            pass
+
+        try:
+            return self.get_timestamps(day)[0]
+        except IndexError:
+            raise FileNotFoundError
 
     def set_newest(self, day: datetime.date, timestamp: datetime.datetime):
-        return
+        """Point ".newest" of the given day to the given revision."""
+
+        newest_path = self.get_plan_path(day, ".newest")
+        target_name = self.get_plan_path(day, timestamp).name
 
-        # newest_path = self.get_plan_path(day, ".newest")
-        # target_path = self.get_plan_path(day, timestamp)
-        #
-        # newest_path.unlink(missing_ok=True)
-        # try:
-        #     newest_path.symlink_to(target_path, target_is_directory=True)
-        # except FileExistsError:
-        #     pass
+        # rewriting would change the mtime of the day directory and make every process rescan it
+        if not newest_path.is_symlink():
+            try:
+                if newest_path.read_text("utf-8") == target_name:
+                    return
+            except FileNotFoundError:
+                pass
+
+        temp_file_path = _temp_path(newest_path)
+
+        with open(temp_file_path, "w", encoding="utf-8") as f:
+            f.write(target_name)
+
+        # also atomically replaces symlinks left over from older versions
+        temp_file_path.replace(newest_path)
 
     def update_newest(self, day: datetime.date):
-        pass
-        # timestamps = self.get_timestamps(day)
-        # self.get_plan_path(day, ".newest").unlink(missing_ok=True)
-        # if timestamps:
-        #     self.set_newest(day, timestamps[0])
+        timestamps = self.get_timestamps(day)
+        if timestamps:
+            self.set_newest(day, timestamps[0])
+        else:
+            self.get_plan_path(day, ".newest").unlink(missing_ok=True)
 
     def plan_file_exists(self,
                          day: datetime.date,
                          timestamp: datetime.datetime | str,
                          filename: str,
                          links_allowed: bool = True) -> bool:
-        path = self.get_plan_path(day, timestamp) / filename
-        return path.exists() and (links_allowed or not path.is_symlink())
+        try:
+            path = self.get_plan_path(day, self.resolve_timestamp(day, timestamp)) / filename
+        except FileNotFoundError:
+            return False
+
+        return any(
+            variant_path.exists() and (links_allowed or not variant_path.is_symlink())
+            for variant_path, _ in self._file_variants(path)
+        )
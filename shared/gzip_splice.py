@@ -0,0 +1,113 @@
+"""Gzip members whose contents can be extended without decompressing them.
+
+compress() ends the deflate stream of a member with a byte-aligned block holding only the last byte of the data
+(the closing brace of a JSON object). splice() swaps that block for a freshly compressed suffix and puts a prefix in
+front, so a stored JSON object can be sent wrapped into a response and with additional fields while only the prefix
+and the suffix are compressed per request.
+"""
+
+from __future__ import annotations
+
+import struct
+import zlib
+
+_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x02\xff"
+# an empty stored block, what a sync flush emits
+_SYNC_MARKER = b"\x00\x00\xff\xff"
+_LEVEL = 9
+
+
+def _raw_deflate(data: bytes, mode: int) -> bytes:
+    compressor = zlib.compressobj(_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(mode)
+
+
+def compress(data: bytes) -> bytes:
+    """Like gzip.compress(data, mtime=0), but the result can be passed to splice()."""
+    body = _raw_deflate(data[:-1], zlib.Z_SYNC_FLUSH) + _raw_deflate(data[-1:], zlib.Z_FINISH)
+    return _HEADER + body + struct.pack("<II", zlib.crc32(data), len(data) & 0xffffffff)
+
+
+# CRC-32 arithmetic as in zlib's crc32.c, polynomials are stored reflected
+
+_POLY = 0xedb88320
+
+
+def _multmodp(a: int, b: int) -> int:
+    m = 1 << 31
+    p = 0
+    while True:
+        if a & m:
+            p ^= b
+            if a & (m - 1) == 0:
+                break
+        m >>= 1
+        b = (b >> 1) ^ _POLY if b & 1 else b >> 1
+    return p
+
+
+# x^(2^n) modulo the polynomial
+_X2N_TABLE = [1 << 30]
+for _ in range(31):
+    _X2N_TABLE.append(_multmodp(_X2N_TABLE[-1], _X2N_TABLE[-1]))
+
+
+def _crc32_combine(crc1: int, crc2: int, len2: int) -> int:
+    """Return the CRC-32 of A + B given the CRC-32 of A, the CRC-32 of B and the length of B."""
+    p = 1 << 31
+    k = 3
+    while len2:
+        if len2 & 1:
+            p = _multmodp(_X2N_TABLE[k & 31], p)
+        len2 >>= 1
+        k += 1
+    return _multmodp(p, crc1) ^ crc2
+
+
+_CRC_TABLE = []
+for _n in range(256):
+    _c = _n
+    for _ in range(8):
+        _c = (_c >> 1) ^ _POLY if _c & 1 else _c >> 1
+    _CRC_TABLE.append(_c)
+# the top bytes of the table entries are unique, which makes a byte step invertible
+_CRC_TABLE_BY_TOP_BYTE = {entry >> 24: n for n, entry in enumerate(_CRC_TABLE)}
+
+
+def _crc32_remove_last_byte(crc: int, byte: int) -> int:
+    """Return the CRC-32 of A given the CRC-32 of A + bytes([byte])."""
+    c = crc ^ 0xffffffff
+    n = _CRC_TABLE_BY_TOP_BYTE[c >> 24]
+    c = (((c ^ _CRC_TABLE[n]) << 8) & 0xffffffff) | (n ^ byte)
+    return c ^ 0xffffffff
+
+
+def splice(prefix: bytes, member: bytes, last_byte: bytes, suffix: bytes) -> bytes | None:
+    """Return a gzip member of prefix + data[:-1] + suffix, where data are the contents of member and end with
+    last_byte. Returns None if member was not created by compress() or does not end with last_byte."""
+    tail = _raw_deflate(last_byte, zlib.Z_FINISH)
+    body_end = len(member) - 8 - len(tail)
+
+    if (
+        not member.startswith(_HEADER[:4])  # no optional header fields
+        or len(member) < len(_HEADER) + len(_SYNC_MARKER) + len(tail) + 8
+        or member[body_end:-8] != tail
+        or member[body_end - len(_SYNC_MARKER):body_end] != _SYNC_MARKER
+    ):
+        return None
+
+    crc, size = struct.unpack("<II", member[-8:])
+    body_crc = _crc32_remove_last_byte(crc, last_byte[0])
+    body_size = size - 1
+
+    crc = _crc32_combine(zlib.crc32(prefix), body_crc, body_size)
+    crc = zlib.crc32(suffix, crc)
+    size = len(prefix) + body_size + len(suffix)
+
+    return b"".join((
+        _HEADER,
+        _raw_deflate(prefix, zlib.Z_SYNC_FLUSH),
+        member[len(_HEADER):body_end],
+        _raw_deflate(suffix, zlib.Z_FINISH),
+        struct.pack("<II", crc, size & 0xffffffff),
+    ))
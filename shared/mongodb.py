@@ -1,7 +1,14 @@
+import atexit
 import logging
+import os
+import queue
+import threading
+import time
 
 import dotenv.main as dotenv
+import pymongo.collection
 import pymongo.database
+import pymongo.errors
 
 ENABLED: bool
 DATABASE: pymongo.database.Database | None
@@ -30,3 +37,105 @@ def _init():
 
 
 _init()
+
+
+_STOP = object()
+
+
+class BatchWriter:
+    """Inserts documents into a collection in batches from a single background thread.
+
+    Documents are flushed with insert_many once max_batch_size documents are queued or max_delay seconds have passed.
+    If more than max_queue_size documents are waiting, new ones are dropped and the number of dropped documents is
+    logged with the next flush. Remaining documents are flushed when the interpreter exits.
+    """
+
+    def __init__(self, collection: pymongo.collection.Collection, *, max_batch_size: int = 500,
+                 max_delay: float = 5.0, max_queue_size: int = 10_000, name: str = "batch_writer"):
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._logger = logging.getLogger(name)
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # threads don't survive forks of pre-forking servers, so (re)start lazily in the current process
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name=self._logger.name, daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, document: dict):
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(document)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.max_delay
+
+            while len(batch) < self.max_batch_size:
+                try:
+                    document = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+                if document is _STOP:
+                    self._flush(batch)
+                    return
+
+                batch.append(document)
+
+            self._flush(batch)
+
+    def _flush(self, batch: list[dict]):
+        with self._lock:
+            dropped, self._dropped = self._dropped, 0
+
+        if dropped:
+            self._logger.warning(f"Dropped {dropped} documents because the queue was full.")
+
+        if not batch:
+            return
+
+        try:
+            self.insert(batch)
+        except pymongo.errors.PyMongoError:
+            self._logger.exception(f"Failed to insert {len(batch)} documents.")
+            self.on_failed(batch)
+
+    def insert(self, batch: list[dict]):
+        self.collection.insert_many(batch, ordered=False)
+
+    def on_failed(self, batch: list[dict]):
+        """Called with a batch that could not be inserted."""
+
+    def close(self, timeout: float = 10):
+        """Flush all queued documents and stop the background thread."""
+        if self._pid != os.getpid() or self._thread is None:
+            return
+
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            self._logger.warning("Could not flush queued documents on shutdown.")
+            return
+
+        self._thread.join(timeout)
+        self._pid = None
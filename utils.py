@@ -1,5 +1,6 @@
 import secrets
 import threading
+import time
 import os
 import json
 import contextlib
@@ -9,7 +10,7 @@ from typing import List
 from copy import deepcopy
 
 from werkzeug.security import safe_join
-from flask import Flask, Response, jsonify
+from flask import Flask, Response, jsonify, request
 import pymongo
 from bson import ObjectId
 from flask_login import UserMixin, current_user
@@ -43,22 +44,80 @@ def send_error(msg: str) -> Response:
     return jsonify({"success": False, "error": msg})
 
 
+def accepted_encodings() -> list[str]:
+    """Return the content encodings cached files can be stored with that the current client accepts."""
+    return [encoding for encoding in shared.cache.ENCODINGS if encoding in request.accept_encodings]
+
+
+def send_encoded(body: bytes, encoding: str | None = None, mimetype: str = "application/json") -> Response:
+    """Send an already serialized body. If encoding is given, body is already compressed with it.
+
+    Flask-Compress skips responses that already have a Content-Encoding, so pre-compressed bodies are sent as-is.
+    """
+    response = Response(body, mimetype=mimetype)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+    return response
+
+
 # USER MANAGEMENT
+# seconds a user document may be served from the process-wide cache, 0 disables it
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 5))
+_user_cache: dict[str, tuple[float, dict]] = {}
+_user_cache_lock = threading.Lock()
+
+
+def load_user(user_id: str) -> dict | None:
+    """Return the user document, served from the process-wide cache if it is younger than USER_CACHE_TTL."""
+    if USER_CACHE_TTL > 0:
+        with _user_cache_lock:
+            cached = _user_cache.get(user_id)
+        if cached is not None and time.monotonic() - cached[0] < USER_CACHE_TTL:
+            return deepcopy(cached[1])
+
+    user = users.find_one({'_id': ObjectId(user_id)})
+
+    if USER_CACHE_TTL > 0 and user is not None:
+        now = time.monotonic()
+        with _user_cache_lock:
+            if len(_user_cache) > 10_000:
+                for key, (timestamp, _) in list(_user_cache.items()):
+                    if now - timestamp >= USER_CACHE_TTL:
+                        del _user_cache[key]
+            _user_cache[user_id] = now, deepcopy(user)
+
+    return user
+
+
+def invalidate_user(user_id: str):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
 class User(UserMixin):
-    def __init__(self, mongo_id: str):
+    def __init__(self, mongo_id: str, user: dict | None = None):
         self.mongo_id = mongo_id
-        self.user = None
+        # loaded at most once per instance, which Flask-Login creates once per request
+        self.user = user
 
     def get_id(self):
         return self.mongo_id
 
     def get_user(self):
-        self.user = users.find_one({'_id': ObjectId(self.mongo_id)})
+        if self.user is None:
+            self.user = load_user(self.mongo_id)
         return self.user
 
+    def invalidate(self):
+        """Drop cached versions of the user document. Must be called after modifying it."""
+        self.user = None
+        invalidate_user(self.mongo_id)
+
     def update_field(self, field, value):
         self.get_user()
         users.update_one({'_id': ObjectId(self.mongo_id)}, {"$set": {field: value}})
+        self.invalidate()
 
     def get_field(self, field, default=None):
         self.get_user()
@@ -75,6 +134,7 @@ class User(UserMixin):
             tmp_authorized_schools.append(school_num)
             users.update_one({'_id': ObjectId(self.mongo_id)},
                              {"$set": {'authorized_schools': tmp_authorized_schools}})
+            self.invalidate()
 
     def get_settings(self):
         self.get_user()
@@ -101,6 +161,7 @@ class User(UserMixin):
             new_settings[setting] = cur_setting
 
         users.update_one({'_id': ObjectId(self.mongo_id)}, {"$set": {'settings': new_settings}})
+        self.invalidate()
         return send_success()
 
     # get setting for user, if setting not set get default setting
@@ -155,6 +216,7 @@ class User(UserMixin):
             favorite["preferences"] = [elem for elem in favorite["preferences"] if elem in available_preferences]
             new_favorites.append(favorite)
         users.update_one({'_id': ObjectId(self.mongo_id)}, {"$set": {'favourites': new_favorites}})
+        self.invalidate()
         return send_success(new_favorites)
 
     def generate_ical_tokens(self, overwrite: bool = False):
@@ -182,6 +244,7 @@ class User(UserMixin):
             )
 
         users.update_one({'_id': ObjectId(self.mongo_id)}, {"$set": {'favourites': new_favs}})
+        self.invalidate()
 
 
 def resolve_ical_token(token: str) -> tuple[str, int] | None:
@@ -194,7 +257,7 @@ def resolve_ical_token(token: str) -> tuple[str, int] | None:
 
 def get_user(user_id):
     try:
-        return users.find_one({'_id': ObjectId(user_id)})
+        return load_user(user_id)
     except Exception:
         return
 
@@ -408,9 +471,11 @@ def update_database():
     VALID_SCHOOLS = [elem["_id"] for elem in list(creds.find({}))]
 
 
-@run_in_background
+_request_log_writer = shared.mongodb.BatchWriter(meta, name="request_log_writer")
+
+
 def meta_to_database(request_data):
-    meta.insert_one(request_data)
+    _request_log_writer.submit(request_data)
 
 
 if __name__ == "__main__":